@@ -0,0 +1,39 @@
+"""Torch model for SteveTheBuilder's action_mask observations.
+
+The observations hold the usual observation array under "observations" and
+a 0/1 mask of the valid discrete actions under "action_mask". The model runs
+a fully connected network on the observation array and pushes the outputs of
+masked actions to the lowest float, so they are never sampled (PPO) or picked
+as the best action (DQN, with "hiddens": [] and "dueling": False so the
+outputs are the Q-values)."""
+
+import torch
+import torch.nn as nn
+from ray.rllib.models import ModelCatalog
+from ray.rllib.models.torch.fcnet import FullyConnectedNetwork
+from ray.rllib.models.torch.torch_modelv2 import TorchModelV2
+
+FLOAT_MIN = torch.finfo(torch.float32).min
+
+
+class ActionMaskModel(TorchModelV2, nn.Module):
+    def __init__(self, obs_space, action_space, num_outputs, model_config, name):
+        TorchModelV2.__init__(self, obs_space, action_space, num_outputs, model_config, name)
+        nn.Module.__init__(self)
+        # RLlib flattens Dict observation spaces, keeping the Dict as original_space.
+        original_space = getattr(obs_space, "original_space", obs_space)
+        self.internal_model = FullyConnectedNetwork(original_space["observations"], action_space, num_outputs,
+                                                    model_config, name + "_internal")
+
+    def forward(self, input_dict, state, seq_lens):
+        action_mask = input_dict["obs"]["action_mask"]
+        logits, _ = self.internal_model({"obs": input_dict["obs"]["observations"]})
+        # log(1) = 0 leaves valid actions alone, log(0) = -inf is clamped to FLOAT_MIN.
+        inf_mask = torch.clamp(torch.log(action_mask), min=FLOAT_MIN)
+        return logits + inf_mask, state
+
+    def value_function(self):
+        return self.internal_model.value_function()
+
+
+ModelCatalog.register_custom_model("action_mask", ActionMaskModel)
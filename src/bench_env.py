@@ -0,0 +1,251 @@
+"""Offline micro-benchmarks of the SteveTheBuilder hot paths.
+
+Feeds observations recorded from flat and hill missions, with continuous and
+discrete movement, through get_observation, step_reward, is_facing_ghast and
+get_mission_xml, without a Minecraft client. The fixtures are recorded on the
+sim backend (sim_malmo.py), not from a real Malmo client, so they follow the
+simulator's observations: payload sizes and entity counts may differ from
+real traffic.
+
+    python bench_env.py                      # run and print ops/sec
+    python bench_env.py --save-baseline      # also store the results as the baseline
+    python bench_env.py --check              # fail if slower than the baseline,
+                                             # saved by --save-baseline beforehand
+    python bench_env.py --record             # re-record the fixtures on the sim backend
+    python bench_env.py --startup            # also time a rollout worker's startup
+
+Allocation is reported as the peak memory one call allocates on top of what
+was live before it, as measured by tracemalloc."""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import main
+import sim_malmo
+from constants import ProblemType
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASELINE_FILE = os.path.join(FIXTURE_DIR, "bench_baseline.json")
+
+# Fixture name -> (problem type, discrete moves).
+CONFIGS = {
+    'flat_continuous': (ProblemType.flat, False),
+    'flat_discrete': (ProblemType.flat, True),
+    'hill_continuous': (ProblemType.hill, False),
+    'hill_discrete': (ProblemType.hill, True),
+}
+FRAMES_PER_FIXTURE = 20
+
+# Seconds every benchmark runs for, best of REPEATS.
+MIN_TIME = 0.3
+REPEATS = 3
+
+# What a rollout worker does to start sampling: import main, build an
+# environment and reset it, in a fresh interpreter. Prints the seconds each
+# took and which of the modules environments should not need were imported.
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+env = main.SteveTheBuilder({'backend': 'sim', 'sim_seed': 0, 'metrics_file': None})
+built = time.perf_counter()
+env.reset()
+reset = time.perf_counter()
+print(json.dumps({'import': imported - start, 'construct': built - imported, 'first_reset': reset - built,
+                  'trainer_modules': sorted(name for name in ('ray.rllib.agents', 'torch', 'matplotlib', 'MalmoPython')
+                                            if name in sys.modules)}))
+"""
+STARTUP_REPEATS = 5
+
+
+def make_env(name: str):
+    """Returns an environment configured like the fixture, with no mission running."""
+    problem_type, discrete_moves = CONFIGS[name]
+    env = main.SteveTheBuilder({'backend': 'sim', 'sim_seed': 0, 'metrics_file': None,
+                                'problem_type': problem_type, 'discrete_moves': discrete_moves})
+    env.log_frequency = 10 ** 9
+    return env
+
+
+def fixture_path(name: str) -> str:
+    return os.path.join(FIXTURE_DIR, f"{name}.jsonl")
+
+
+def record_fixtures(seed: int = 0) -> None:
+    """Records FRAMES_PER_FIXTURE observations per config from the sim backend."""
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for name in CONFIGS:
+        env = make_env(name)
+        env.action_space.seed(seed)
+        np.random.seed(seed)
+        frames = []
+        while len(frames) < FRAMES_PER_FIXTURE:
+            env.reset()
+            done = False
+            while not done and len(frames) < FRAMES_PER_FIXTURE:
+                _, _, done, _ = env.step(env.action_space.sample())
+                if env.frame is not None and env.episode_step % 3 == 0:
+                    frames.append({'observation': json.dumps(env.frame.observations),
+                                   'rewards': [r.getValue() for r in env.synchronizer.rewards]})
+        with open(fixture_path(name), 'w') as f:
+            for frame in frames:
+                f.write(json.dumps(frame) + "\n")
+        print(f"Recorded {len(frames)} frames to {fixture_path(name)}")
+
+
+def load_world_states(name: str):
+    """Returns the recorded observations of a config as Malmo-like world states."""
+    world_states = []
+    with open(fixture_path(name)) as f:
+        for line in f:
+            frame = json.loads(line)
+            world_states.append(sim_malmo.WorldState(
+                True, True, [sim_malmo.TimestampedString(frame['observation'])],
+                [sim_malmo.TimestampedReward(value) for value in frame['rewards']]))
+    return world_states
+
+
+def benchmarks(env, world_states):
+    """Returns name -> callable running the benchmark once on the i-th world state."""
+    frames = []
+    for world_state in world_states:
+        env.synchronizer.observe(world_state)
+        frames.append(env.synchronizer.frame)
+
+    def get_observation(i):
+        # Decoding included, as the synchronizer does it for every step.
+        world_state = world_states[i]
+        env.synchronizer.since_tick = None
+        env.synchronizer.observe(world_state)
+        return env.get_observation(world_state)
+
+    def step_reward(i):
+        return env.step_reward(world_states[i].rewards, frames[i])
+
+    def is_facing_ghast(i):
+        return env.is_facing_ghast(frames[i])
+
+    def get_mission_xml(i):
+        return env.get_mission_xml()
+
+    return {
+        'get_observation': get_observation,
+        'step_reward': step_reward,
+        'is_facing_ghast': is_facing_ghast,
+        'get_mission_xml': get_mission_xml,
+    }
+
+
+def measure(function, n: int) -> dict:
+    """Returns ops/sec and peak bytes allocated per call of function(i), i cycling through n inputs."""
+    best = 0.0
+    for _ in range(REPEATS):
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < MIN_TIME:
+            for i in range(n):
+                function(i)
+            calls += n
+            elapsed = time.perf_counter() - start
+        best = max(best, calls / elapsed)
+
+    peak = 0
+    tracemalloc.start()
+    for i in range(n):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        function(i)
+        _, after = tracemalloc.get_traced_memory()
+        peak = max(peak, after - before)
+    tracemalloc.stop()
+    return {'ops_per_sec': best, 'peak_alloc_bytes': peak}
+
+
+def run() -> dict:
+    results = {}
+    for name in CONFIGS:
+        env = make_env(name)
+        world_states = load_world_states(name)
+        for benchmark, function in benchmarks(env, world_states).items():
+            results[f"{name}/{benchmark}"] = measure(function, len(world_states))
+    return results
+
+
+def measure_startup(repeats: int = STARTUP_REPEATS) -> dict:
+    """Returns the median seconds of every phase of STARTUP_SCRIPT, and of
+    the whole process including interpreter startup, over repeats runs."""
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        process = time.perf_counter() - start
+        runs.append(dict(json.loads(output.splitlines()[-1]), process=process))
+    results = {phase: statistics.median(run[phase] for run in runs)
+               for phase in ('import', 'construct', 'first_reset', 'process')}
+    results['trainer_modules'] = runs[-1]['trainer_modules']
+    return results
+
+
+def check(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns the benchmarks more than threshold (a fraction) slower than the baseline."""
+    regressions = []
+    for key, result in results.items():
+        if key in baseline:
+            expected = baseline[key]['ops_per_sec']
+            if result['ops_per_sec'] < expected * (1 - threshold):
+                regressions.append((key, expected, result['ops_per_sec']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline SteveTheBuilder hot path benchmarks.")
+    parser.add_argument('--record', action='store_true', help="re-record the fixtures on the sim backend")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--check', action='store_true', help="exit with 1 if slower than the baseline")
+    parser.add_argument('--startup', action='store_true', help="also time a rollout worker's startup")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="fraction of the baseline ops/sec a benchmark may lose before --check fails")
+    args = parser.parse_args()
+
+    # The baseline is machine-specific and not checked in.
+    if args.check and not args.save_baseline and not os.path.exists(BASELINE_FILE):
+        sys.exit(f"No baseline at {BASELINE_FILE}, run with --save-baseline first.")
+
+    if args.record:
+        record_fixtures()
+
+    results = run()
+    print(f"{'benchmark':42} {'ops/sec':>12} {'peak alloc/call':>16}")
+    for key, result in results.items():
+        print(f"{key:42} {result['ops_per_sec']:12.0f} {result['peak_alloc_bytes']:14d} B")
+
+    if args.startup:
+        startup = measure_startup()
+        print(f"\n{'startup (median of ' + str(STARTUP_REPEATS) + ')':42} {'seconds':>12}")
+        for phase in ('import', 'construct', 'first_reset', 'process'):
+            print(f"{phase:42} {startup[phase]:12.3f}")
+        print(f"{'trainer modules imported':42} {', '.join(startup['trainer_modules']) or 'none':>12}")
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {BASELINE_FILE}")
+
+    if args.check:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        regressions = check(results, baseline, args.threshold)
+        for key, expected, actual in regressions:
+            print(f"REGRESSION {key}: {actual:.0f} ops/sec, baseline {expected:.0f}")
+        sys.exit(1 if regressions else 0)
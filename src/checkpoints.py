@@ -0,0 +1,134 @@
+"""Trainer checkpoints written off the training loop, with rotation and resume.
+
+A checkpoint is a directory checkpoint_<iteration> holding the trainer's
+state as trainer.save_to_object() returns it, in trainer.pkl, and the
+episode statistics of every environment in env_stats.pkl. The trainer's
+state is taken on the training thread through RLlib's public API, so the
+checkpoints do not depend on the layout trainer.save() writes, which changes
+between RLlib versions; it is written to disk by a background thread while
+training goes on. Checkpoints are written to a temporary directory and
+renamed once complete, so a run killed mid-write resumes from the previous
+checkpoint."""
+
+import os
+import pickle
+import queue
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+ENV_STATS_FILE = "env_stats.pkl"
+TRAINER_FILE = "trainer.pkl"
+PREFIX = "checkpoint_"
+
+
+def checkpoint_dirs(directory: str) -> List[Tuple[int, str]]:
+    """Returns (iteration, path) of the complete checkpoints in directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    checkpoints = []
+    for name in os.listdir(directory):
+        if name.startswith(PREFIX) and name[len(PREFIX):].isdigit() and \
+                os.path.exists(os.path.join(directory, name, TRAINER_FILE)):
+            checkpoints.append((int(name[len(PREFIX):]), os.path.join(directory, name)))
+    return sorted(checkpoints)
+
+
+def latest_checkpoint(directory: str) -> Optional[str]:
+    """Returns the path of the newest checkpoint in directory, None if there is none."""
+    checkpoints = checkpoint_dirs(directory)
+    if not checkpoints:
+        return None
+    return checkpoints[-1][1]
+
+
+def restore_trainer(trainer, checkpoint_path: str) -> None:
+    """Loads a checkpoint's trainer state into the trainer."""
+    with open(os.path.join(checkpoint_path, TRAINER_FILE), 'rb') as f:
+        trainer.restore_from_object(f.read())
+
+
+def collect_env_stats(trainer) -> Dict[Tuple[int, int], dict]:
+    """Returns the EpisodeStats.state() of every environment of the trainer's
+    rollout workers, by (worker index, sub-environment index)."""
+    def collect(worker):
+        return [((worker.worker_index, env.client.vector_index), env.stats.state())
+                for env in worker.foreach_env(lambda env: env)
+                if hasattr(env, 'stats') and hasattr(env, 'client')]
+    return dict(entry for entries in trainer.workers.foreach_worker(collect) for entry in entries)
+
+
+def restore_env_stats(trainer, env_stats: Dict[Tuple[int, int], dict]) -> None:
+    """Loads the episode statistics collected by collect_env_stats() into the
+    environments of the trainer's rollout workers."""
+    def restore(worker):
+        for env in worker.foreach_env(lambda env: env):
+            if hasattr(env, 'stats') and hasattr(env, 'client'):
+                state = env_stats.get((worker.worker_index, env.client.vector_index))
+                if state is not None:
+                    env.load_stats_state(state)
+    trainer.workers.foreach_worker(restore)
+
+
+def load_env_stats(checkpoint_path: str) -> Dict[Tuple[int, int], dict]:
+    """Returns the environments' episode statistics of a checkpoint, empty if it has none."""
+    path = os.path.join(checkpoint_path, ENV_STATS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class CheckpointWriter:
+    """Writes checkpoints to a directory on a background thread, keeping the
+    newest keep of them.
+
+    save() waits for the previous checkpoint to be written first, so at most
+    one trainer state is held in memory besides the trainer's own."""
+
+    def __init__(self, directory: str, keep: int = 3):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.run, name="CheckpointWriter", daemon=True)
+        self.thread.start()
+
+    def save(self, trainer) -> None:
+        """Takes the trainer's state and environment statistics, and queues them to be written."""
+        state = trainer.save_to_object()
+        self.queue.put((trainer.iteration, state, collect_env_stats(trainer)))
+
+    def close(self) -> None:
+        """Waits for the queued checkpoint to be written."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self) -> None:
+        while True:
+            checkpoint = self.queue.get()
+            if checkpoint is None:
+                return
+            try:
+                self.write(*checkpoint)
+                self.prune()
+            except OSError as e:
+                print("Error writing checkpoint:", e)
+
+    def write(self, iteration: int, state: bytes, env_stats: dict) -> None:
+        path = os.path.join(self.directory, f"{PREFIX}{iteration}")
+        partial = path + ".tmp"
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        with open(os.path.join(partial, TRAINER_FILE), 'wb') as f:
+            f.write(state)
+        with open(os.path.join(partial, ENV_STATS_FILE), 'wb') as f:
+            pickle.dump(env_stats, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(partial, path)
+        print(f"Saved checkpoint {path}")
+
+    def prune(self) -> None:
+        """Deletes all but the newest keep checkpoints."""
+        for _, path in checkpoint_dirs(self.directory)[:-self.keep]:
+            shutil.rmtree(path, ignore_errors=True)
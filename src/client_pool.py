@@ -0,0 +1,70 @@
+from typing import List, Tuple
+
+# Minecraft clients to use when none are configured.
+DEFAULT_CLIENTS = ["127.0.0.1:10000"]
+DEFAULT_PORT = 10000
+
+
+class ClientAssignment:
+    """The Minecraft client one environment runs its missions on, and the
+    Malmo role and experiment id it starts them with."""
+
+    def __init__(self, host: str, port: int, slot: int, worker_index: int = 0, vector_index: int = 0):
+        self.host = host
+        self.port = port
+        # Position of the environment among all environments of the run.
+        self.slot = slot
+        self.worker_index = worker_index
+        self.vector_index = vector_index
+        # SteveTheBuilder missions have a single agent.
+        self.role = 0
+        # Unique per environment, so a client never mistakes another
+        # environment's mission for its own.
+        self.experiment_id = f"SteveTheBuilder-{slot}"
+
+    def __repr__(self):
+        return f"{self.host}:{self.port} (slot {self.slot}, worker {self.worker_index}, sub-env {self.vector_index})"
+
+
+def parse_client(entry: str) -> Tuple[str, int]:
+    """Returns (host, port) of a "host:port" entry. A bare port means
+    localhost, a bare host means the default Malmo port."""
+    entry = entry.strip()
+    if entry.isdigit():
+        return "127.0.0.1", int(entry)
+    host, _, port = entry.rpartition(':')
+    if not host:
+        return entry, DEFAULT_PORT
+    return host, int(port)
+
+
+def load_clients(clients: List[str] = None, client_file: str = None) -> List[Tuple[str, int]]:
+    """Returns the (host, port) entries of the client pool. Entries come from
+    client_file if given (one per line, # starts a comment), otherwise from
+    clients, otherwise DEFAULT_CLIENTS."""
+    if client_file is not None:
+        with open(client_file) as f:
+            clients = [line.split('#')[0] for line in f]
+        clients = [line for line in clients if line.strip()]
+    if not clients:
+        clients = DEFAULT_CLIENTS
+    return [parse_client(entry) for entry in clients]
+
+
+def assign_client(pool: List[Tuple[str, int]], env_config, envs_per_worker: int = 1,
+                  clients_per_env: int = 1, index: int = 0) -> ClientAssignment:
+    """Returns a client of the environment described by an RLlib env_config.
+
+    Remote rollout workers are numbered from 1 and each runs envs_per_worker
+    sub-environments, so every sub-environment of every worker gets its own
+    slots. An environment using clients_per_env clients gets that many
+    consecutive slots, index picking one of them. The local worker (index 0)
+    only samples when there are no remote workers, so it shares the slots of
+    worker 1. Slots wrap around the pool when there are more environments
+    than clients."""
+    worker_index = getattr(env_config, 'worker_index', 0)
+    vector_index = getattr(env_config, 'vector_index', 0)
+    env_slot = max(worker_index - 1, 0) * envs_per_worker + vector_index
+    slot = env_slot * clients_per_env + index
+    host, port = pool[slot % len(pool)]
+    return ClientAssignment(host, port, slot, worker_index, vector_index)
@@ -0,0 +1,108 @@
+import shlex
+import socket
+import subprocess
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from client_pool import ClientAssignment
+
+
+class ClientError(RuntimeError):
+    """A Minecraft client failed to start or run a mission."""
+
+
+class ClientSupervisor:
+    """Keeps one environment's missions running on a healthy Minecraft client.
+
+    An environment starts its missions on its assigned client. When a client
+    fails to start a mission, or hangs mid-episode, it is reported here and
+    left alone for cooldown seconds (restarted through restart_command, if
+    set), and missions move on to the first spare client that passes its
+    health check. The environment goes back to its assigned client once that
+    one passes its health check again. With every client down, start() keeps
+    retrying until failover_timeout passes, so a worker's throughput drops
+    while clients restart instead of the worker exiting.
+
+    The health check is a TCP connection to the client's Malmo port, which
+    fails fast on a crashed client or an unreachable machine."""
+
+    def __init__(self, client: ClientAssignment, spares: List[Tuple[str, int]] = (), check_health: bool = True,
+                 probe_timeout: float = 2.0, cooldown: float = 30.0, failover_timeout: float = 600.0,
+                 restart_command: Optional[str] = None):
+        self.client = client
+        # Spares are shared by every environment, so each one tries them
+        # starting at its own slot to spread out the failovers.
+        offset = client.slot % len(spares) if spares else 0
+        self.spares = [ClientAssignment(host, port, client.slot, client.worker_index, client.vector_index)
+                       for host, port in spares[offset:] + spares[:offset]]
+        self.check_health = check_health
+        self.probe_timeout = probe_timeout
+        self.cooldown = cooldown
+        self.failover_timeout = failover_timeout
+        self.restart_command = restart_command
+        # time.time() until which each (host, port) is left alone.
+        self.down_until: Dict[Tuple[str, int], float] = {}
+        self.failures = 0
+        self.failovers = 0
+
+    def healthy(self, client: ClientAssignment) -> bool:
+        """Whether a client is out of its cooldown and accepts connections."""
+        if time.time() < self.down_until.get((client.host, client.port), 0):
+            return False
+        if not self.check_health:
+            return True
+        try:
+            with socket.create_connection((client.host, client.port), timeout=self.probe_timeout):
+                return True
+        except OSError:
+            return False
+
+    def candidates(self) -> Iterator[ClientAssignment]:
+        """Yields the healthy clients to start a mission on, the assigned one first."""
+        for client in [self.client] + self.spares:
+            if self.healthy(client):
+                yield client
+
+    def report_failure(self, client: ClientAssignment, reason: str) -> None:
+        """Puts a client in its cooldown, restarting it if restart_command is set."""
+        print(f"Minecraft client {client} failed: {reason}")
+        self.failures += 1
+        self.down_until[(client.host, client.port)] = time.time() + self.cooldown
+        if self.restart_command is not None:
+            command = self.restart_command.format(host=client.host, port=client.port)
+            try:
+                subprocess.Popen(shlex.split(command), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except OSError as e:
+                print(f"Could not restart Minecraft client {client}: {e}")
+
+    def start(self, start_mission: Callable[[ClientAssignment], object]):
+        """
+        Starts a mission on the first healthy client it starts on, retrying
+        until failover_timeout passes.
+
+        Args
+            start_mission: <callable> starts the mission on the given client and
+                returns its first world state, raising ClientError on failure
+
+        Returns
+            client: <ClientAssignment> the client the mission started on
+            world_state: <object> the mission's first world state
+        """
+        deadline = time.time() + self.failover_timeout
+        while True:
+            for client in self.candidates():
+                try:
+                    world_state = start_mission(client)
+                except ClientError as e:
+                    self.report_failure(client, str(e))
+                    continue
+                if client is not self.client:
+                    self.failovers += 1
+                return client, world_state
+            if time.time() > deadline:
+                raise ClientError(f"No Minecraft client started a mission within {self.failover_timeout} seconds.")
+            # Wait for the next client to come out of its cooldown, or a
+            # while before probing clients that refused connections again.
+            now = time.time()
+            waits = [until - now for until in self.down_until.values() if until > now]
+            time.sleep(max(min(waits, default=self.probe_timeout), 0.1))
@@ -0,0 +1,174 @@
+"""Entities in sight of the agent, as NumPy arrays indexed by id and type.
+
+Malmo lists the entities of an observation under "entitySight" as one dict
+each. EntityTracker turns that list into arrays once per observation and
+carries every entity's position over to the next observation, matched by
+id, so velocities, relative positions and bearings of all entities are
+computed in a few array operations however many mobs and fireballs there
+are."""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from observation_frame import ObservationFrame
+
+# Half of the field of view, in degrees, in which the agent faces an entity.
+FACING_DEGREES = 70
+
+
+def bearing(dx: np.ndarray, dz: np.ndarray) -> np.ndarray:
+    """Returns the Minecraft yaw in [0, 360) facing along (dx, dz): yaw 0
+    faces +z, yaw 90 faces -x. NaN where dx and dz are both 0."""
+    yaw = np.arctan2(-dx, dz)
+    yaw *= 180 / np.pi
+    yaw %= 360
+    yaw[(dx == 0) & (dz == 0)] = np.nan
+    return yaw
+
+
+def facing(target_yaw: np.ndarray, yaw: np.ndarray, degrees: float = FACING_DEGREES) -> np.ndarray:
+    """Whether an agent with the given yaw faces the targets: whether the
+    angle between them, wrapped to [-180, 180), is within degrees either way.
+    Yaws may be in any range, so Minecraft's accumulated rotationYaw and the
+    simulators' wrapped yaw compare alike. False where the target yaw is NaN."""
+    difference = (target_yaw - yaw + 180) % 360 - 180
+    return np.abs(difference) <= degrees
+
+
+class EntityTracker:
+    """Tracks the entities of consecutive observations of one mission.
+
+    After observe(frame), entity i has id ids[i], name names[i], position
+    positions[i] and yaw yaws[i]; index maps ids to i and of_type() names to
+    the indices of that type. The velocities (blocks per tick), and the
+    position relative to the agent, distance and bearing (the yaw facing the
+    entity) of all entities are computed together on first access, so steps
+    that read none of them do not pay for them."""
+
+    def __init__(self, agent_name: str = "SteveTheBuilder"):
+        self.agent_name = agent_name
+        self.clear()
+
+    def clear(self) -> None:
+        """Forgets every entity, e.g. at the start of an episode."""
+        self.frame: Optional[ObservationFrame] = None
+        self.tick = None
+        self.updates = 0
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.positions = np.zeros((0, 3))
+        self.yaws = np.zeros(0)
+        self.agent: Optional[int] = None
+        # Tick (or update, without TotalTime) each entity was first seen on.
+        self.first_seen: Dict[str, float] = {}
+        self._motions = np.zeros((0, 3))
+        # (current index, previous index) of the entities seen on the previous
+        # observation too, the previous positions and the ticks in between.
+        self._matched: List[tuple] = []
+        self._previous_positions = self.positions
+        self._elapsed = 0
+        self._by_type: Dict[str, np.ndarray] = {}
+        self._velocities: Optional[np.ndarray] = None
+        self._relative: Optional[np.ndarray] = None
+        self._distances: Optional[np.ndarray] = None
+        self._bearings: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def observe(self, frame: Optional[ObservationFrame]) -> None:
+        """Updates the entities from a frame. Observing the same frame twice
+        changes nothing, so every consumer of a step can call this."""
+        if frame is None or frame is self.frame:
+            return
+        sight = frame.observations.get('entitySight', ())
+        tick = frame.total_time
+        if tick is None:
+            tick = self.updates
+        self.updates += 1
+
+        # One pass over the JSON entries, everything else on the arrays.
+        data = np.array([(entity['x'], entity['y'], entity['z'], entity.get('yaw', 0.0),
+                          entity.get('motionX', 0.0), entity.get('motionY', 0.0), entity.get('motionZ', 0.0))
+                         for entity in sight], dtype=float).reshape(-1, 7)
+        ids = [entity.get('id', '') for entity in sight]
+        names = [entity['name'] for entity in sight]
+
+        previous_index = self.index
+        self._matched = [(i, previous_index[id]) for i, id in enumerate(ids) if id in previous_index]
+        self._previous_positions = self.positions
+        self._elapsed = tick - self.tick if self.tick is not None else 0
+        first_seen = self.first_seen
+        self.first_seen = {id: first_seen.get(id, tick) for id in ids}
+
+        self.frame = frame
+        self.tick = tick
+        self.ids, self.names = ids, names
+        self.index = {id: i for i, id in enumerate(ids)}
+        self.positions, self.yaws, self._motions = data[:, :3], data[:, 3], data[:, 4:]
+        self.agent = names.index(self.agent_name) if self.agent_name in names else None
+        self._by_type = {}
+        self._velocities = self._relative = self._distances = self._bearings = None
+
+    @property
+    def velocities(self) -> np.ndarray:
+        """Position change per tick since the previous observation, or
+        Malmo's motion estimate for entities not on it."""
+        if self._velocities is None:
+            velocities = self._motions.copy()
+            if self._matched and self._elapsed > 0:
+                current, previous = np.array(self._matched).T
+                velocities[current] = (self.positions[current] - self._previous_positions[previous]) / self._elapsed
+            self._velocities = velocities
+        return self._velocities
+
+    @property
+    def relative(self) -> np.ndarray:
+        """Positions relative to the agent, NaN if the agent is not in sight."""
+        if self._relative is None:
+            if self.agent is not None:
+                self._relative = self.positions - self.positions[self.agent]
+            else:
+                self._relative = np.full_like(self.positions, np.nan)
+        return self._relative
+
+    @property
+    def distances(self) -> np.ndarray:
+        if self._distances is None:
+            relative = self.relative
+            self._distances = np.sqrt(np.einsum('ij,ij->i', relative, relative))
+        return self._distances
+
+    @property
+    def bearings(self) -> np.ndarray:
+        """Yaw in [0, 360) the agent faces each entity at, NaN for the agent itself."""
+        if self._bearings is None:
+            relative = self.relative
+            self._bearings = bearing(relative[:, 0], relative[:, 2])
+        return self._bearings
+
+    def of_type(self, name: str) -> np.ndarray:
+        """Returns the indices of the entities with the given name, in observation order."""
+        indices = self._by_type.get(name)
+        if indices is None:
+            indices = self._by_type[name] = np.array([i for i, n in enumerate(self.names) if n == name], dtype=int)
+        return indices
+
+    def first(self, name: str) -> Optional[int]:
+        """Returns the index of the first entity with the given name, None if not in sight."""
+        indices = self.of_type(name)
+        return int(indices[0]) if len(indices) else None
+
+    def ages(self) -> np.ndarray:
+        """Returns the ticks (or updates) every entity has been in sight for."""
+        return self.tick - np.array([self.first_seen[id] for id in self.ids], dtype=float)
+
+    def facing(self, indices: np.ndarray = None) -> np.ndarray:
+        """Returns whether the agent faces each of the entities (all by
+        default). False for all of them if the agent is not in sight."""
+        bearings = self.bearings if indices is None else self.bearings[indices]
+        if self.agent is None:
+            return np.zeros(len(bearings), dtype=bool)
+        return facing(bearings, self.yaws[self.agent])
@@ -0,0 +1,118 @@
+"""Recordings of SteveTheBuilder steps, for replaying them without a client.
+
+A recording is two append-only files: "<path>.steps" holds one fixed-size
+STEP_DTYPE record per reset or step, and "<path>.obs" the raw observation
+JSON of all of them back to back. EpisodeRecording memory-maps both, so
+reading a step copies nothing until its JSON is decoded."""
+
+import json
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+
+from observation_frame import ObservationFrame
+
+# Record kinds.
+RESET = 0
+STEP = 1
+# A step whose action was dropped without reaching the client.
+REJECTED = 2
+
+STEP_DTYPE = np.dtype([
+    ('kind', np.uint8),
+    ('done', np.bool_),
+    # Discrete actions are stored in action[0].
+    ('action', np.float32, (3, )),
+    # Sum of the Malmo rewards of the step, before the env's own reward terms.
+    ('malmo_reward', np.float32),
+    # Reward the env returned for the step.
+    ('reward', np.float32),
+    ('timestamp', np.float64),
+    # Byte range of the observation JSON in the .obs file, empty if the step
+    # had no observation.
+    ('obs_offset', np.int64),
+    ('obs_length', np.int32),
+])
+
+
+class EpisodeRecorder:
+    """Appends resets and steps to a recording. Each run starts the files over."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.steps_file = open(path + ".steps", 'wb')
+        self.obs_file = open(path + ".obs", 'wb')
+        self.obs_offset = 0
+        self.record = np.zeros(1, dtype=STEP_DTYPE)
+
+    def append(self, kind: int, frame: Optional[ObservationFrame], action=None,
+               malmo_reward: float = 0.0, reward: float = 0.0, done: bool = False) -> None:
+        record = self.record[0]
+        record['kind'] = kind
+        record['done'] = done
+        record['action'] = 0
+        if action is not None:
+            record['action'][:np.size(action)] = action
+        record['malmo_reward'] = malmo_reward
+        record['reward'] = reward
+        record['timestamp'] = time.time()
+
+        text = b""
+        if frame is not None:
+            text = frame.text.encode() if frame.text is not None else json.dumps(frame.observations).encode()
+        record['obs_offset'] = self.obs_offset
+        record['obs_length'] = len(text)
+        self.obs_file.write(text)
+        self.obs_offset += len(text)
+        self.steps_file.write(self.record.tobytes())
+
+        # Flushed once per episode, so readers see whole episodes.
+        if done:
+            self.flush()
+
+    def flush(self) -> None:
+        self.obs_file.flush()
+        self.steps_file.flush()
+
+    def close(self) -> None:
+        self.steps_file.close()
+        self.obs_file.close()
+
+
+class EpisodeRecording:
+    """Read-only view of a recording, memory-mapped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.steps = np.memmap(path + ".steps", dtype=STEP_DTYPE, mode='r')
+        self.obs = np.memmap(path + ".obs", dtype=np.uint8, mode='r')
+        # Index of every reset, i.e. of every episode's first record.
+        self.episode_starts = np.flatnonzero(self.steps['kind'] == RESET)
+
+    def __len__(self) -> int:
+        """Number of episodes."""
+        return len(self.episode_starts)
+
+    def episode(self, index: int) -> np.ndarray:
+        """Returns the records of an episode, its reset first."""
+        start = self.episode_starts[index]
+        end = self.episode_starts[index + 1] if index + 1 < len(self.episode_starts) else len(self.steps)
+        return self.steps[start:end]
+
+    def observation_bytes(self, record) -> memoryview:
+        """Returns the raw observation JSON of a record, without copying it."""
+        offset = int(record['obs_offset'])
+        return memoryview(self.obs[offset:offset + int(record['obs_length'])])
+
+    def frame(self, record) -> Optional[ObservationFrame]:
+        """Returns the decoded observation of a record, None if it had none."""
+        if record['obs_length'] == 0:
+            return None
+        text = self.observation_bytes(record)
+        return ObservationFrame(json.loads(bytes(text)), len(text))
+
+    def frames(self, index: int) -> Iterator:
+        """Yields (record, frame) for every record of an episode."""
+        for record in self.episode(index):
+            yield record, self.frame(record)
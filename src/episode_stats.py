@@ -0,0 +1,135 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+# One row per episode.
+STATS_DTYPE = np.dtype([
+    # Training steps taken by the end of the episode.
+    ('step', np.int64),
+    ('episode_return', np.float32),
+    ('blocks_placed', np.int32),
+    ('damage_taken', np.int32),
+    ('face_ghast_count', np.int32),
+    ('correct_position_block', np.int32),
+    # Mean fraction of the Ghasts whose line of sight placed blocks covered.
+    ('shelter_coverage', np.float32),
+    # Fraction of the cells around the agent holding placed blocks, at the end.
+    ('enclosure', np.float32),
+    # Mean observation JSON bytes per tick.
+    ('payload_size', np.float32),
+])
+
+
+class EpisodeStats:
+    """Per-episode statistics in a fixed-size NumPy ring buffer.
+
+    Only the last capacity episodes are kept in memory, so a long run uses
+    the same memory as a short one. With a spill_path, every full buffer is
+    appended to that file before it is overwritten, and windows reaching
+    further back are read from it through a memory map.
+
+    With resume, the spill file of the previous run is kept, for
+    load_state() to continue it."""
+
+    def __init__(self, capacity: int = 1024, spill_path: Optional[str] = None, resume: bool = False):
+        self.capacity = capacity
+        self.records = np.zeros(capacity, dtype=STATS_DTYPE)
+        # Episodes appended so far, in memory or not.
+        self.count = 0
+        # First episode the spill file holds, past 0 after load_state() of
+        # a state missing the oldest episodes.
+        self.first = 0
+        self.spill_path = spill_path
+        if spill_path is not None and not resume:
+            # Each run starts the file over.
+            open(spill_path, 'wb').close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def spilled(self) -> int:
+        """Number of episodes written to the spill file."""
+        if self.spill_path is None:
+            return 0
+        return max(self.count // self.capacity * self.capacity - self.first, 0)
+
+    def append(self, **fields) -> None:
+        """Appends one episode. Fields missing from STATS_DTYPE are rejected,
+        fields not given are 0."""
+        row = np.zeros((), dtype=STATS_DTYPE)
+        for name, value in fields.items():
+            row[name] = value
+        self.records[self.count % self.capacity] = row
+        self.count += 1
+        if self.spill_path is not None and self.count % self.capacity == 0:
+            with open(self.spill_path, 'ab') as f:
+                self.records.tofile(f)
+
+    def last(self, field: str = None):
+        """Returns the latest episode as a dict, or one field of it."""
+        row = self.records[(self.count - 1) % self.capacity]
+        if field is not None:
+            return row[field].item()
+        return {name: row[name].item() for name in STATS_DTYPE.names}
+
+    def window(self, n: int = None) -> np.ndarray:
+        """
+        Returns the last n episodes, oldest first. Episodes that are neither
+        in memory nor spilled are left out.
+
+        Args
+            n: <int> number of episodes, all of them if None
+        """
+        n = self.count if n is None else min(n, self.count)
+        start = self.count - n
+        in_memory = min(self.count - self.first, self.capacity)
+        if n <= in_memory:
+            return self.ordered(n)
+        if self.spilled == 0:
+            return self.ordered(in_memory)
+
+        # Old episodes from the spill file, the rest from memory.
+        spill = np.memmap(self.spill_path, dtype=STATS_DTYPE, mode='r', shape=(self.spilled, ))
+        return np.concatenate([spill[max(start - self.first, 0):], self.ordered(self.count - self.first - self.spilled)])
+
+    def ordered(self, n: int) -> np.ndarray:
+        """Returns the last n episodes in memory, oldest first."""
+        indices = np.arange(self.count - n, self.count) % self.capacity
+        return self.records[indices]
+
+    def state(self) -> dict:
+        """Returns the episodes in memory and how many of them were spilled,
+        e.g. to checkpoint them. Spilled episodes stay in the spill file."""
+        in_memory = min(self.count - self.first, self.capacity)
+        return {'count': self.count, 'first': self.first, 'spilled': self.spilled, 'records': self.ordered(in_memory)}
+
+    def load_state(self, state: dict) -> None:
+        """Replaces the episodes with those of a state(), e.g. to resume a run.
+        The spill file, if any, is cut back to the episodes spilled when the
+        state was taken. If it holds fewer, it starts over with the restored
+        episodes and the older ones are left out."""
+        records = state['records']
+        self.count = state['count']
+        self.records[:] = 0
+        kept = records[-self.capacity:]
+        self.records[np.arange(self.count - len(kept), self.count) % self.capacity] = kept
+        spilled_size = state.get('spilled', 0) * STATS_DTYPE.itemsize
+        if self.spill_path is not None and spilled_size > 0 and \
+                os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) >= spilled_size:
+            self.first = state['first']
+            os.truncate(self.spill_path, spilled_size)
+            return
+        self.first = self.count - len(records)
+        if self.spill_path is not None:
+            with open(self.spill_path, 'wb') as f:
+                records[:self.spilled].tofile(f)
+
+    def aggregate(self, n: int = None) -> Dict[str, float]:
+        """Returns the mean of every field over the last n episodes, and the
+        number of episodes as "episodes"."""
+        records = self.window(n)
+        summary = {name: float(records[name].mean()) if len(records) else 0.0 for name in STATS_DTYPE.names}
+        summary['episodes'] = len(records)
+        return summary
@@ -0,0 +1,93 @@
+"""Encoding of the "nearbyVolume" grid of block names into observation channels.
+
+Every block name is looked up once in a vocabulary built from the blocks the
+observation tells apart, and the resulting ids are turned into channels by
+indexing a precomputed table, so encoding a grid costs one dict lookup per
+block done in C and a single NumPy take, however many blocks and channels.
+Rotating the grid to the agent's yaw reorders the ids through a permutation
+precomputed for each quarter turn, before they are turned into channels."""
+
+from itertools import repeat
+from typing import Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+# Block names Malmo reports for blocks that observations treat as another.
+BLOCK_ALIASES = {
+    "flowing_water": "water",
+    "flowing_lava": "lava",
+}
+
+
+def quarter_turns(yaw: Union[float, np.ndarray]):
+    """Returns the quarter turns (np.rot90's k over the z and x axes) that
+    orient a grid to the agent's yaw, in degrees: 0 for yaws in [135, 225),
+    1 in [225, 315), 2 in [315, 45) and 3 in [45, 135)."""
+    turns = ((yaw + 45) % 360 // 90 + 2) % 4
+    return turns.astype(int) if isinstance(turns, np.ndarray) else int(turns)
+
+
+class GridEncoder:
+    """Encodes grids of blocks into one channel per block type of blocks:
+    channel c of a block is 1 where it is blocks[c], else 0. The output is
+    channel-major, i.e. reshapes to (channels, y, z, x) for grids listed in
+    Malmo's order, which is the (y, z, x) shape given."""
+
+    def __init__(self, blocks: Sequence[str], shape: Tuple[int, int, int]):
+        self.blocks = tuple(blocks)
+        self.shape = tuple(shape)
+        self.volume = int(np.prod(shape))
+        # rotations[k] lists, for every block of a grid turned k quarter
+        # turns, the block of the unturned grid it comes from.
+        self.rotations = np.stack([np.rot90(np.arange(self.volume).reshape(self.shape), k=k, axes=(1, 2)).ravel()
+                                   for k in range(4)])
+        # The ids of the grid being encoded, rotated, reused by every encode().
+        self._rotated_ids = np.zeros(self.volume, dtype=np.uint8)
+        # Vocabulary id of every known name, the last id (OTHER) for the rest.
+        self.vocabulary = {name: i for i, name in enumerate(self.blocks)}
+        for alias, name in BLOCK_ALIASES.items():
+            if name in self.vocabulary:
+                self.vocabulary[alias] = self.vocabulary[name]
+        self.other = len(self.blocks)
+        # table[c, id] is channel c of a block with vocabulary id id.
+        self.table = np.zeros((len(self.blocks), len(self.blocks) + 1), dtype=np.float32)
+        self.table[np.arange(len(self.blocks)), np.arange(len(self.blocks))] = 1
+
+    @property
+    def channels(self) -> int:
+        return len(self.blocks)
+
+    @property
+    def length(self) -> int:
+        """Number of values an encoded grid takes up."""
+        return self.channels * self.volume
+
+    def ids(self, names: Iterable[str], count: int = -1) -> np.ndarray:
+        """Returns the vocabulary ids of block names, as uint8."""
+        return np.fromiter(map(self.vocabulary.get, names, repeat(self.other)), dtype=np.uint8, count=count)
+
+    def encode(self, names: List[str], out: np.ndarray, turns: int = 0) -> np.ndarray:
+        """
+        Writes the channels of a grid of block names into out, and returns out.
+
+        Args
+            names: <list> block names of the grid, as in "nearbyVolume"
+            out: <np.ndarray> float32 array of self.length values to write to
+            turns: <int> quarter turns to rotate the grid by, see quarter_turns()
+        """
+        ids = self.ids(names, self.volume)
+        # Indices are always in range, and take() only writes to out directly,
+        # without a temporary, in a mode other than "raise". The methods skip
+        # the np.take() wrapper, which costs more than the gathers themselves.
+        if turns:
+            ids = ids.take(self.rotations[turns], out=self._rotated_ids, mode='clip')
+        self.table.take(ids, axis=1, out=out.reshape(self.channels, self.volume), mode='clip')
+        return out
+
+    def encode_ids(self, ids: np.ndarray, turns: np.ndarray = None) -> np.ndarray:
+        """Returns the channels of n grids of vocabulary ids, given as an
+        (n, volume) array, as an (n, channels * volume) array, each grid
+        rotated by its turns if given."""
+        if turns is not None:
+            ids = np.take_along_axis(ids, self.rotations[turns], axis=1)
+        return np.moveaxis(self.table[:, ids], 0, 1).reshape(len(ids), self.length)
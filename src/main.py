@@ -1,30 +1,41 @@
 # Rllib docs: https://docs.ray.io/en/latest/rllib.html
 # Malmo XML docs: https://docs.ray.io/en/latest/rllib.html
 
-try:
-    from malmo import MalmoPython
-except:
-    import MalmoPython
+# This module only holds the environment and its configuration, so rollout
+# workers building environments import neither Ray's trainers nor Malmo
+# (until a "malmo" environment is built). The trainer is in train.py.
 
-import sys
+import os
 import time
-import json
 from typing import List, Optional
-import matplotlib.pyplot as plt
 import numpy as np
 from numpy.random import randint
 import math
 
-import gym, ray
-from numpy.random.mtrand import f
-from gym.spaces import Discrete, Box
-from ray.rllib.agents import ppo
-from ray.rllib.agents import dqn
-import collections
+import gym
+from gym.spaces import Discrete, Box, Dict
 
+import sim_malmo
+import step_profiler
+from client_pool import assign_client, load_clients, parse_client
+from client_supervisor import ClientError, ClientSupervisor
 from constants import ProblemType
+from episode_recorder import REJECTED, RESET, STEP, EpisodeRecorder
+from entity_tracker import EntityTracker
+from episode_stats import EpisodeStats
+from grid_encoding import GridEncoder, quarter_turns
+from metrics_log import MetricsWriter
+from mission_layout import fill_commands, parse_mission_xml
+from mission_standby import MissionStandby
+from observation_frame import ObservationFrame
+from shelter_index import ShelterIndex
+from step_profiler import ProfiledAgentHost
+from step_sync import AsyncStepSynchronizer, StepSynchronizer
+from terrain_cache import TerrainCache
 
 # Problem setup parameters
+# These are the defaults, every environment can override them through
+# env_config, e.g. {'problem_type': 'flat', 'discrete_moves': True}.
 
 # changes terrain (flat vs hill side)
 problem_type = ProblemType.hill
@@ -41,8 +52,15 @@ reward_blocks = True
 
 # reward for facing ghast
 reward_facing_ghast = True
-# reward for placing blocks amount
-reward_mult = 5
+
+# reward, every step, the fraction of the Ghasts in sight whose line of sight
+# to the agent goes through blocks it placed (see shelter_index.py).
+reward_shelter = False
+# track the blocks placed for the shelter_coverage and enclosure statistics
+# even when reward_shelter is off; costs some 20-25 microseconds a step.
+log_shelter = False
+# reward for placing blocks amount, per block placed
+reward_mult = 1
 
 # Compresses the observation space by not giving the agent its yaw value
 # and instead changing the arrangement of nearby blocks to match
@@ -61,31 +79,266 @@ obs_pitch = True
 
 mob_type = "Ghast"
 
-# Verify that the parameters will result in an environment that has been
-# configured. Not all combinations of parameters have been set up properly,
-# so this provides a scalable way of avoiding those combinations.
+# Give discrete-move environments a Dict observation, with the observation
+# array under "observations" and under "action_mask" a 0/1 mask of the
+# actions step_action would carry out, for action_mask_model.ActionMaskModel.
+# Looks past the two allowed pitches are dropped without waiting on the
+# client either way, the step returning the previous observation and no
+# reward.
+# Can be overridden per environment through env_config.
+action_mask = False
+
+# Every this many dropped actions in a row, step() polls the client anyway,
+# so an episode of dropped actions still notices the mission ending.
+rejected_action_poll_every = 8
+
+# Block types the observation grid tells apart, one channel of the grid each,
+# e.g. ("stone", "air", "cobblestone", "water"). Blocks of any other type are
+# 0 in every channel. None gives the single channel of whether each block is
+# the player's block (cobblestone).
+# Can be overridden per environment through env_config.
+grid_blocks = None
+
+# Which Malmo implementation the environment talks to.
+# "malmo" uses MalmoPython and a running Minecraft client.
+# "sim" uses the in-process NumPy simulator in sim_malmo.py, which needs no
+# game client. Pair it with "event" step_sync, the simulator only advances
+# when polled so fixed sleeps only slow it down.
+# Can be overridden per environment through env_config.
+backend = "malmo"
+
+# Minecraft clients as "host:port" entries. Every rollout worker and vector
+# sub-environment runs its missions on a client of its own, and the launcher
+# starts one rollout worker per envs_per_worker clients.
+clients = ["127.0.0.1:10000"]
+
+# File with one "host:port" entry per line. Overrides clients when set.
+client_file = None
+
+# Sub-environments (and so clients) per rollout worker.
+envs_per_worker = 1
+
+# Minecraft clients as "host:port" entries that no environment is assigned.
+# An environment whose client fails to start a mission, or hangs, moves its
+# missions to the first of them that passes its health check, until its own
+# client passes it again.
+spare_clients = []
+
+# Seconds a failed client is left alone before missions are started on it
+# again, and seconds an environment keeps retrying while every client is down
+# before giving up with a ClientError.
+client_cooldown = 30
+client_failover_timeout = 600
+
+# Seconds the health check waits for a client to accept a connection, and
+# seconds a started mission has to begin.
+client_probe_timeout = 2.0
+mission_start_timeout = 60
+
+# Steps in a row without an observation after which the client counts as
+# hung. The episode then ends, and the next one starts on a healthy client.
+client_hang_steps = 3
+
+# Shell command restarting a failed Minecraft client, formatted with its
+# {host} and {port}, e.g. "ssh {host} ./launchClient.sh -port {port}".
+# None leaves restarting clients to the user.
+client_restart_command = None
+
+# Keep the mission running between episodes. reset() then only redraws the
+# terrain around the agent (undoing placed blocks), teleports the agent to a
+# new spawn, refills inventory slot 0 and respawns the Ghast, through chat
+# commands. The mission is reloaded when the agent died, the mission ended,
+# or every soft_reset_full_every episodes.
+soft_reset = False
+soft_reset_full_every = 20
+
+# Start the next episode's mission on a standby Minecraft client while the
+# current episode is still running, so reset() swaps clients instead of
+# waiting for a mission to load. Every environment then uses two clients, and
+# the launcher starts one rollout worker per 2 * envs_per_worker clients.
+# With soft_reset on, only the episodes that end in a full reload use it.
+pipelined_reset = False
+
+# Steps before the command quota at which the standby mission is started.
+# The standby mission ticks (and its Ghast shoots) from then on, so keep this
+# just long enough to cover the mission load time.
+pipeline_lookahead = 10
+
+# Directory to save the terrain of each ProblemType to, after drawing it once.
+# Later missions start from the saved world through FileWorldGenerator
+# instead of drawing the terrain again. Paths are on the Minecraft client's
+# machine, so this needs clients sharing this machine's filesystem, and
+# minecraft_saves_dir set to their saves directory. None draws the terrain
+# on every mission. The "sim" backend ignores it.
+terrain_cache_dir = None
+minecraft_saves_dir = None
+
+# What the mission asks the client to observe and render.
+# "full" requests video and every observation producer the mission ever had.
+# "lean" requests no video and only the observations the reward and
+# observation flags above use: no ObservationFromRay, the hotbar instead of
+# the full inventory, and entities only within entity_range_scale times the
+# enemy spawn distance (none if no flag uses them).
+# Can be overridden per environment through env_config.
+observation_profile = "full"
+entity_range_scale = 3
+
+# Append-only episode metrics and the "step<TAB>return" text log. Every
+# environment but the first adds its client slot to the names, as do the
+# graphs plot_metrics.py renders from them. None disables both.
+metrics_file = "metrics.bin"
+returns_file = "returns.txt"
+
+# Episodes of statistics every environment keeps in memory. With
+# episode_stats_spill_file set, older episodes are written to that file (with
+# the client slot added like metrics_file) instead of being dropped.
+episode_stats_capacity = 1024
+episode_stats_spill_file = None
+
+# Time the step path (commands, polls, JSON decoding, reward terms,
+# observation encoding, mission starts) into latency histograms. Their
+# p50/p95/p99 are added to every trainer.train() result as "step_profile" and
+# written to profile_file; each environment also writes its worker's to
+# profile_file with its client slot added. Off, the hooks cost next to nothing.
+profile_steps = False
+profile_file = "profile.json"
+
+# Record every reset and step (action, observation JSON, rewards, time) to
+# this path, with the client slot added like metrics_file, as the
+# "<path>.steps" and "<path>.obs" files replay_env.ReplayEnv plays back.
+# None records nothing.
+record_file = None
+
+# Train on the episodes recorded to this path through replay_env.ReplayEnv
+# instead of on live missions.
+replay_file = None
+
+# Directory train.py checkpoints the trainer and the environments' episode
+# statistics to, every checkpoint_every train() iterations, keeping the
+# newest checkpoint_keep checkpoints. None saves none.
+checkpoint_dir = "checkpoints"
+checkpoint_every = 10
+checkpoint_keep = 3
+
+# Resume training from the newest checkpoint in checkpoint_dir, if any.
+resume = True
+
+# Number of worlds sim_vector_env.SimVectorEnv steps at once when training on
+# the "sim" backend. 0 trains one SteveTheBuilder per rollout worker instead.
+sim_num_worlds = 0
+
+# How step() waits for the observation that follows an action.
+# "event" polls until the first observation produced after the command landed.
+# "async" waits for the same observation, but a background thread sends each
+# step's commands in one batch and keeps polling and decoding world states
+# while the policy computes the next action, waking step() once it arrives.
+# "legacy" sleeps 0.2 seconds after each action, then polls every 0.1 seconds.
+# Can be overridden per environment through env_config.
+step_sync = "event"
+
+# With "async" step_sync, let a step's observation be the first one
+# action_repeat ticks past the previous step's observation, instead of past
+# the step's own commands. Game ticks then run while the policy computes the
+# next action instead of after it, at the cost of the observation lagging the
+# latest action by up to the inference time.
+async_overlap = False
+
+# Milliseconds per Minecraft server tick, sent as the mission's MsPerTick.
+# Minecraft runs at 50, lower values run the game faster than realtime.
+ms_per_tick = 50
+
+# Game ticks every action is held for before the step observes its result,
+# the step's reward adding up the rewards of all of them. The command quota
+# counts commands, so episodes stay max_episode_steps steps long and last
+# action_repeat times as many ticks.
+action_repeat = 1
+
+# Seconds an "event" or "async" step waits for that observation before giving up on it.
+step_sync_timeout = 2.0
+
+# Seconds between world state polls of an "event" step or the "async" thread,
+# i.e. the most a step waits past the arrival of its observation.
+step_sync_latency_target = 0.005
+
+# Command line arguments for Malmo's AgentHost.parse(), e.g. ["--record_video"].
+# None parses none, so environments never see the trainer's command line.
+agent_host_args = None
+
 parameter_not_configured_msg = "{} parameter not configured for current world type. Should be left as: {}."
-if problem_type is ProblemType.flat:
-    pass
-elif problem_type is ProblemType.hill:
-    assert not random_spawn,  parameter_not_configured_msg.format("random_spawn", False)
 
-if yaw_obs_simplifier:
-    assert reward_facing_ghast, "yaw_obs_simplifier being True prevents any additional observations, including [reward_facing_ghast]."
+# Settings above that env_config can override per environment, plus the keys
+# only env_config sets. Any other key is rejected, so a misspelled setting in
+# a Tune search space fails instead of silently running the default.
+ENV_CONFIG_KEYS = frozenset([
+    'problem_type', 'discrete_moves', 'random_spawn', 'reward_blocks', 'reward_facing_ghast', 'reward_shelter',
+    'log_shelter', 'reward_mult', 'yaw_obs_simplifier', 'obs_ghast_coordinate', 'obs_pitch', 'mob_type',
+    'action_mask', 'rejected_action_poll_every', 'grid_blocks', 'backend', 'clients', 'client_file',
+    'envs_per_worker', 'spare_clients', 'client_cooldown', 'client_failover_timeout', 'client_probe_timeout',
+    'mission_start_timeout', 'client_hang_steps', 'client_restart_command', 'soft_reset', 'soft_reset_full_every',
+    'pipelined_reset', 'pipeline_lookahead', 'terrain_cache_dir', 'minecraft_saves_dir', 'observation_profile',
+    'entity_range_scale', 'metrics_file', 'returns_file', 'episode_stats_capacity', 'episode_stats_spill_file',
+    'profile_steps', 'profile_file', 'record_file', 'replay_file', 'sim_num_worlds', 'step_sync', 'async_overlap',
+    'ms_per_tick', 'action_repeat', 'step_sync_timeout', 'step_sync_latency_target', 'agent_host_args',
+    # Seed of the sim backend, and set by train.py when it resumes a checkpoint.
+    'sim_seed', 'sim_ticks_per_step', 'resume_stats',
+])
+# Problem setup settings that must be booleans.
+BOOLEAN_SETTINGS = ('discrete_moves', 'random_spawn', 'reward_blocks', 'reward_facing_ghast', 'reward_shelter',
+                    'log_shelter', 'yaw_obs_simplifier', 'obs_ghast_coordinate', 'obs_pitch', 'action_mask')
+
+def import_malmo():
+    """Returns the MalmoPython module, None if Malmo is not installed.
+    Imported on first use, since only "malmo" environments need it."""
+    try:
+        from malmo import MalmoPython
+    except ImportError:
+        try:
+            import MalmoPython
+        except ImportError:
+            return None
+    return MalmoPython
+
 
 class SteveTheBuilder(gym.Env):
 
     def __init__(self, env_config):
-        self.discrete_moves = discrete_moves
+        unknown = sorted(set(env_config) - ENV_CONFIG_KEYS)
+        assert not unknown, f"Unknown env_config keys: {unknown}."
+
+        # Problem Setup
+        # Every environment reads its own from env_config, so environments of
+        # different setups can share a process, e.g. the trials of a Tune sweep.
+        self.problem_type = env_config.get('problem_type', problem_type)
+        if isinstance(self.problem_type, str):
+            assert self.problem_type in ProblemType.__members__, f"Unknown problem_type value: {self.problem_type}."
+            self.problem_type = ProblemType[self.problem_type]
+        assert isinstance(self.problem_type, ProblemType), f"Unknown problem_type value: {self.problem_type}."
+        self.discrete_moves = env_config.get('discrete_moves', discrete_moves)
+        self.random_spawn = env_config.get('random_spawn', random_spawn)
+        self.reward_blocks = env_config.get('reward_blocks', reward_blocks)
+        self.reward_facing_ghast = env_config.get('reward_facing_ghast', reward_facing_ghast)
+        self.reward_shelter = env_config.get('reward_shelter', reward_shelter)
+        self.log_shelter = env_config.get('log_shelter', log_shelter)
+        self.reward_mult = env_config.get('reward_mult', reward_mult)
+        self.yaw_obs_simplifier = env_config.get('yaw_obs_simplifier', yaw_obs_simplifier)
+        self.obs_ghast_coordinate = env_config.get('obs_ghast_coordinate', obs_ghast_coordinate)
+        self.obs_pitch = env_config.get('obs_pitch', obs_pitch)
+        self.mob_type = env_config.get('mob_type', mob_type)
+        self.action_mask = env_config.get('action_mask', action_mask)
+        self.rejected_action_poll_every = env_config.get('rejected_action_poll_every', rejected_action_poll_every)
+        self.validate_problem_setup()
 
         # Static Parameters
         self.size = 50
         self.enemy_spawn_distance = 4
         self.obs_size = 3
         self.obs_height = 3
+        # Lowest y of the observation grid, relative to the agent's feet.
+        self.obs_low_y = -1
         self.max_episode_steps = 100 if self.discrete_moves else 300
         self.log_frequency = 10
         self.block_quantity = 63
+        self.player_block = "cobblestone"
     
         if self.discrete_moves:
             self.action_dict = {
@@ -103,37 +356,151 @@ class SteveTheBuilder(gym.Env):
             self.action_space = Box(low=np.array([-1.0, -1.0, -1.0]),
                             high=np.array([1.0, 1.0, 1.0]))
         
+        self.grid_encoder = GridEncoder(env_config.get('grid_blocks', grid_blocks) or (self.player_block, ),
+                                        (self.obs_height, self.obs_size, self.obs_size))
         obs_space_tmp = self.obs_array_length()
         
         self.observation_space = Box(-self.size * 2, self.size * 2, shape=(obs_space_tmp, ), dtype=np.float32)
+        if self.action_mask:
+            self.observation_space = Dict({
+                'action_mask': Box(0, 1, shape=(self.action_space.n, ), dtype=np.float32),
+                'observations': self.observation_space,
+            })
+
+        # Profiling
+        self.profiler = step_profiler.profiler
+        if env_config.get('profile_steps', profile_steps):
+            self.profiler.enabled = True
+        self.profile_file = env_config.get('profile_file', profile_file)
 
         # Malmo Parameters
-        self.agent_host = MalmoPython.AgentHost()
-        try:
-            self.agent_host.parse( sys.argv )
-        except RuntimeError as e:
-            print('ERROR:', e)
-            print(self.agent_host.getUsage())
-            exit(1)
-
-        # Constants
-        self.player_block = "cobblestone"
+        self.backend = env_config.get('backend', backend)
+        self.sim_seed = env_config.get('sim_seed')
+        if self.backend == "sim":
+            self.malmo = sim_malmo
+        else:
+            assert self.backend == "malmo", f"Unknown backend value: {self.backend}."
+            self.malmo = import_malmo()
+            assert self.malmo is not None, "MalmoPython could not be imported, only the \"sim\" backend is available."
+        self.agent_host_args = env_config.get('agent_host_args', agent_host_args)
+        self.agent_host = self.create_agent_host(self.sim_seed)
+
+        # Minecraft Client
+        self.pipelined_reset = env_config.get('pipelined_reset', pipelined_reset)
+        self.pipeline_lookahead = env_config.get('pipeline_lookahead', pipeline_lookahead)
+        clients_per_env = 2 if self.pipelined_reset else 1
+        self.client_pool = load_clients(env_config.get('clients', clients), env_config.get('client_file', client_file))
+        self.client = assign_client(self.client_pool, env_config, env_config.get('envs_per_worker', envs_per_worker), clients_per_env)
+        print(f"SteveTheBuilder using Minecraft client {self.client}")
+        self.supervisor = ClientSupervisor(self.client,
+                                           [parse_client(entry) for entry in env_config.get('spare_clients', spare_clients)],
+                                           check_health=self.backend == "malmo",
+                                           probe_timeout=env_config.get('client_probe_timeout', client_probe_timeout),
+                                           cooldown=env_config.get('client_cooldown', client_cooldown),
+                                           failover_timeout=env_config.get('client_failover_timeout', client_failover_timeout),
+                                           restart_command=env_config.get('client_restart_command', client_restart_command))
+        self.mission_start_timeout = env_config.get('mission_start_timeout', mission_start_timeout)
+        self.client_hang_steps = env_config.get('client_hang_steps', client_hang_steps)
+        # Whether the client failed, so the next mission needs a new agent
+        # host, and steps in a row that got no observation.
+        self.client_lost = False
+        self.hung_steps = 0
+
+        # Terrain Cache
+        self.terrain_cache = None
+        if self.backend == "malmo" and env_config.get('terrain_cache_dir', terrain_cache_dir) is not None:
+            self.terrain_cache = TerrainCache(env_config.get('terrain_cache_dir', terrain_cache_dir),
+                                              env_config.get('minecraft_saves_dir', minecraft_saves_dir))
+        # Observation Profile
+        self.observation_profile = env_config.get('observation_profile', observation_profile)
+        assert self.observation_profile in ("full", "lean"), f"Unknown observation_profile value: {self.observation_profile}."
+        self.entity_range = self.enemy_spawn_distance * env_config.get('entity_range_scale', entity_range_scale)
+
+        # Mission XML by (problem type, spawn, world file).
+        self.mission_xml_cache = {}
+
+        # Pipelined Reset
+        self.standby = None
+        if self.pipelined_reset:
+            standby_client = assign_client(self.client_pool, env_config, env_config.get('envs_per_worker', envs_per_worker), clients_per_env, 1)
+            standby_seed = None if self.sim_seed is None else self.sim_seed + 1
+            self.standby = MissionStandby(self.create_agent_host(standby_seed), standby_client, self.start_mission)
+            print(f"SteveTheBuilder using standby Minecraft client {standby_client}")
+        # The DamageTaken statistic is per client and only resets when the
+        # client restarts, so the damage reward is re-based on the first
+        # observation of the run and after switching or restarting clients.
+        self.rebase_damage_taken = True
+
+        # Soft Reset
+        self.soft_reset = env_config.get('soft_reset', soft_reset)
+        self.soft_reset_full_every = env_config.get('soft_reset_full_every', soft_reset_full_every)
+        # Layout of the running mission and of the current episode's spawn.
+        self.mission_layout = None
+        self.episode_layout = None
+        self.episodes_since_full_reset = 0
+
+        # Step Synchronization
+        self.step_sync = env_config.get('step_sync', step_sync)
+        assert self.step_sync in ("event", "async", "legacy"), f"Unknown step_sync value: {self.step_sync}."
+        self.ms_per_tick = env_config.get('ms_per_tick', ms_per_tick)
+        self.action_repeat = env_config.get('action_repeat', action_repeat)
+        assert self.action_repeat >= 1, f"action_repeat must be at least 1, got {self.action_repeat}."
+        synchronizer_config = dict(
+            timeout=env_config.get('step_sync_timeout', step_sync_timeout),
+            latency_target=env_config.get('step_sync_latency_target', step_sync_latency_target),
+            ticks_per_step=self.action_repeat)
+        if self.step_sync == "async":
+            self.synchronizer = AsyncStepSynchronizer(self.agent_host, overlap=env_config.get('async_overlap', async_overlap),
+                                                      **synchronizer_config)
+        else:
+            self.synchronizer = StepSynchronizer(self.agent_host, **synchronizer_config)
 
         # Dynamic Parameters
         self.obs = None
+        # Observation frame decoded for the current step, shared by every
+        # reward and observation function.
+        self.frame = None
         self.episode_step = 0
+        self.episode_commands = 0
         self.episode_return = 0
+        # Observation JSON received this episode, in bytes and frames.
+        self.episode_payload_bytes = 0
+        self.episode_payload_frames = 0
 
         # Data to be keep tracked
-        self.returns = []
-        self.steps = []
-        self.face_ghast_count = []
-        self.blocks_placed = []
-        self.damage_taken = []
-        self.correct_position_block = []
-
-        self.fireballs = collections.defaultdict(dict)
-        self.enemy = collections.defaultdict(dict)
+        suffix = f"-{self.client.slot}" if self.client.slot > 0 else ""
+        spill_path = env_config.get('episode_stats_spill_file', episode_stats_spill_file)
+        if spill_path is not None:
+            spill_path = "{}{}{}".format(os.path.splitext(spill_path)[0], suffix, os.path.splitext(spill_path)[1])
+        # Set by train.py when it restores the statistics from a checkpoint,
+        # see load_stats_state(): the files of the previous run are continued.
+        resume_stats = env_config.get('resume_stats', False)
+        self.stats = EpisodeStats(env_config.get('episode_stats_capacity', episode_stats_capacity), spill_path, resume_stats)
+
+        # Recording
+        self.recorder = None
+        if env_config.get('record_file', record_file) is not None:
+            path = env_config.get('record_file', record_file)
+            self.recorder = EpisodeRecorder(f"{path}{suffix}")
+
+        # Metrics Log
+        self.metrics = None
+        if env_config.get('metrics_file', metrics_file) is not None:
+            path, extension = os.path.splitext(env_config.get('metrics_file', metrics_file))
+            text_path = env_config.get('returns_file', returns_file)
+            if text_path is not None:
+                text_path = "{}{}{}".format(os.path.splitext(text_path)[0], suffix, os.path.splitext(text_path)[1])
+            self.metrics = MetricsWriter(path + suffix + extension, text_path, self.log_frequency, suffix, resume_stats)
+
+        # Entities in sight, tracked across the observations of an episode.
+        self.entities = EntityTracker("SteveTheBuilder")
+        # Blocks placed this episode, for the shelter coverage. Only tracked
+        # when it is rewarded or logged.
+        self.track_shelter = self.reward_shelter or self.log_shelter
+        self.shelter = ShelterIndex(self.player_block, (-(self.obs_size // 2), self.obs_low_y, -(self.obs_size // 2)),
+                                    (self.obs_height, self.obs_size, self.obs_size))
+        self.episode_shelter_coverage = 0
+        self.last_enclosure = 0
 
         self.last_damage_taken = 0
         self.last_block_count = 0
@@ -144,20 +511,64 @@ class SteveTheBuilder(gym.Env):
         # agent starts looking down
         self.looking_down = True
 
-    
+    def validate_problem_setup(self) -> None:
+        """
+        Verify that the parameters will result in an environment that has been
+        configured. Not all combinations of parameters have been set up properly,
+        so this provides a scalable way of avoiding those combinations.
+        """
+        if self.problem_type is ProblemType.flat:
+            pass
+        elif self.problem_type is ProblemType.hill:
+            assert not self.random_spawn, parameter_not_configured_msg.format("random_spawn", False)
+
+        if self.yaw_obs_simplifier:
+            assert self.reward_facing_ghast, "yaw_obs_simplifier being True prevents any additional observations, including [reward_facing_ghast]."
+
+        if self.action_mask:
+            assert self.discrete_moves, "action_mask only applies to discrete_moves."
+
+        for name in BOOLEAN_SETTINGS:
+            value = getattr(self, name)
+            assert isinstance(value, (bool, np.bool_)), f"{name} must be True or False, not {value!r}."
+        assert isinstance(self.reward_mult, (int, float, np.number)) and not isinstance(self.reward_mult, (bool, np.bool_)), \
+            f"reward_mult must be a number, not {self.reward_mult!r}."
+
+    def create_agent_host(self, seed: Optional[int] = None):
+        """
+        Returns a new agent host of the environment's backend.
+
+        Args
+            seed: <int> random seed of a "sim" agent host, ignored by "malmo"
+        """
+        if self.backend == "sim":
+            agent_host = sim_malmo.AgentHost(seed=seed)
+        else:
+            agent_host = self.malmo.AgentHost()
+        if self.agent_host_args is not None:
+            try:
+                agent_host.parse(["SteveTheBuilder"] + list(self.agent_host_args))
+            except RuntimeError as e:
+                print('ERROR:', e)
+                print(agent_host.getUsage())
+                raise
+        if self.profiler.enabled:
+            agent_host = ProfiledAgentHost(agent_host, self.profiler)
+        return agent_host
+
     def obs_array_length(self):
         """Returns the length of the observation array."""
-        length = self.obs_height * self.obs_size * self.obs_size
-        if not yaw_obs_simplifier:
+        length = self.grid_encoder.length
+        if not self.yaw_obs_simplifier:
             length += 1
 
-            if reward_facing_ghast:
+            if self.reward_facing_ghast:
                 length += 1
             
-            if obs_ghast_coordinate:
+            if self.obs_ghast_coordinate:
                 length +=3 
             
-            if obs_pitch:
+            if self.obs_pitch:
                 length += 1
 
         return length
@@ -170,61 +581,196 @@ class SteveTheBuilder(gym.Env):
             observation: <np.array> flattened initial obseravtion
         """
         # Reset Malmo
-        world_state = self.init_malmo()
-
-        # Append episodes data that was tracked
-        self.returns.append(self.episode_return)
-        self.damage_taken.append(self.episode_damage_taken)
-        self.blocks_placed.append(self.last_block_count)
-        self.face_ghast_count.append(self.last_facing_ghast_count)
-        self.correct_position_block.append(self.last_correct_position_block)
-        current_step = self.steps[-1] if len(self.steps) > 0 else 0
-        self.steps.append(current_step + self.episode_step)
-
-        # Reset Variables
+        reset_start = time.perf_counter()
+        self.synchronizer.pause()
+        world_state = None
+        if self.can_soft_reset():
+            world_state = self.soft_reset_mission()
+        if world_state is None:
+            self.quit_mission()
+            if self.standby is not None:
+                world_state = self.take_standby_mission()
+            if world_state is None:
+                world_state = self.init_malmo()
+            self.synchronizer.reset()
+            self.episodes_since_full_reset = 0
+            if self.step_sync != "legacy":
+                world_state = self.synchronizer.wait(world_state)
+        self.episodes_since_full_reset += 1
+        self.profiler.record("reset_mission", time.perf_counter() - reset_start)
+
+        self.append_episode_stats()
+        self.reset_episode_variables()
+
+        # Log
+        if self.metrics is not None and len(self.stats) > 1:
+            self.metrics.append(**self.stats.last())
+        if self.metrics is not None and len(self.stats) > self.log_frequency + 1 and \
+            len(self.stats) % self.log_frequency == 0:
+            self.log_returns()
+
+        # Get Observation
+        self.obs = self.get_observation(world_state)
+        if self.track_shelter:
+            self.shelter.observe(self.frame)
+        if self.rebase_damage_taken and self.frame is not None:
+            self.last_damage_taken = self.frame.damage_taken
+            self.rebase_damage_taken = False
+        if self.recorder is not None:
+            self.recorder.append(RESET, self.frame)
+
+        return self.observation(self.obs)
+
+    def append_episode_stats(self) -> None:
+        """Appends the data tracked over the episode to self.stats."""
+        current_step = self.stats.last('step') if len(self.stats) > 0 else 0
+        self.stats.append(step=current_step + self.episode_step,
+                          episode_return=self.episode_return,
+                          damage_taken=self.episode_damage_taken,
+                          blocks_placed=self.last_block_count,
+                          face_ghast_count=self.last_facing_ghast_count,
+                          correct_position_block=self.last_correct_position_block,
+                          shelter_coverage=self.episode_shelter_coverage / max(self.episode_step, 1),
+                          enclosure=self.last_enclosure,
+                          payload_size=self.episode_payload_bytes / max(self.episode_payload_frames, 1))
+
+    def load_stats_state(self, state: dict) -> None:
+        """Loads episode statistics saved by EpisodeStats.state(), e.g. from a
+        checkpoint, and cuts the metrics log back to them."""
+        self.stats.load_state(state)
+        if self.metrics is not None:
+            self.metrics.truncate(self.stats.last('step') if len(self.stats) > 0 else 0)
+
+    def reset_episode_variables(self) -> None:
+        """Resets the variables tracking the episode."""
         self.episode_return = 0
         self.episode_step = 0
+        self.episode_commands = 0
+        self.episode_payload_bytes = 0
+        self.episode_payload_frames = 0
         self.last_correct_position_block = 0
         self.last_facing_ghast_count = 0
         self.last_block_count = 0
         self.looking_down = True
+        self.rejected_streak = 0
+        self.hung_steps = 0
         self.episode_damage_taken = 0
-        self.fireballs.clear()
+        self.episode_shelter_coverage = 0
+        self.last_enclosure = 0
+        self.entities.clear()
+        self.shelter.clear()
 
-        # Log
-        if len(self.returns) > self.log_frequency + 1 and \
-            len(self.returns) % self.log_frequency == 0:
-            self.log_returns()
+    def take_standby_mission(self):
+        """
+        Switches to the standby client, whose mission was started ahead of
+        time, and makes the client of the finished episode the standby one.
 
-        # Get Observation
-        self.obs = self.get_observation(world_state)
+        Returns
+            world_state: <object> first world state of the standby mission,
+                None if no standby mission was started or it failed to start
+        """
+        if not self.standby.started:
+            return None
+        mission_xml, world_state = self.standby.take()
+        if world_state is None:
+            return None
 
-        return self.obs
-
-    def extract_observations(self, world_state):
-        """Returns latest observation dictionary from world state.
-        Returns None if mission is not running or no new observations."""
-        msg = world_state.observations[-1].text
-        observations = json.loads(msg)
-        return observations
-
-    def extract_obs_running(self, world_state) -> dict:
-        """Returns the world state's observation dictionary given certain conditions.
-        Returns None if the conditions do not apply."""
-        if world_state.is_mission_running and \
-        world_state.number_of_observations_since_last_state > 0:
-            return self.extract_observations(world_state)
-        else:
+        agent_host, client = self.standby.agent_host, self.standby.client
+        self.standby.swap(self.agent_host, self.client)
+        self.agent_host = self.synchronizer.agent_host = agent_host
+        self.client = self.supervisor.client = client
+        self.client_lost = False
+        print(f"SteveTheBuilder switched to Minecraft client {self.client}")
+        self.mission_layout = self.episode_layout = self.parse_mission(mission_xml)
+        self.rebase_damage_taken = True
+        return world_state
+
+    def should_start_standby_mission(self) -> bool:
+        """Whether the standby mission should be started for the next episode."""
+        if self.standby is None or self.standby.started:
+            return False
+        if self.soft_reset and self.episodes_since_full_reset < self.soft_reset_full_every:
+            return False
+        commands_per_step = 1 if self.discrete_moves else 3
+        return self.max_episode_steps - self.episode_commands <= self.pipeline_lookahead * commands_per_step
+
+    def can_soft_reset(self) -> bool:
+        """Whether the next episode can reuse the running mission."""
+        return self.soft_reset and self.mission_layout is not None and not self.client_lost and \
+            self.episodes_since_full_reset < self.soft_reset_full_every and \
+            self.agent_host.peekWorldState().is_mission_running and \
+            self.frame is not None and self.frame.life > 0
+
+    def soft_reset_mission(self):
+        """
+        Starts the next episode in the running mission. Redraws the terrain
+        within reach of the agent, which undoes the blocks it placed, then
+        removes the mobs, teleports and heals the agent, refills inventory
+        slot 0 and summons the Ghast at its new spawn.
+
+        Returns
+            world_state: <object> world state after the reset, None if the
+                mission has to be reloaded instead
+        """
+        layout = self.parse_mission(self.get_mission_xml())
+        if layout.draws != self.mission_layout.draws:
             return None
 
-    def step_reward_blocks(self, world_state, reward_mult: int = 1) -> int:
+        feet = [math.floor(v) for v in self.episode_layout.agent_position]
+        reach = 6
+        commands = [] if self.discrete_moves else ["turn 0", "pitch 0", "use 0"]
+        commands += fill_commands(self.mission_layout,
+                                  (feet[0] - reach, feet[1] - reach, feet[2] - reach),
+                                  (feet[0] + reach, feet[1] + reach, feet[2] + reach))
+        commands.append("chat /kill @e[type=!player]")
+        x, y, z = layout.agent_position
+        commands.append(f"chat /tp @p {x} {y} {z} {layout.agent_yaw} {layout.agent_pitch}")
+        commands.append("chat /clear @p")
+        commands.append(f"chat /replaceitem entity @p slot.hotbar.0 {self.player_block} {self.block_quantity}")
+        commands.append("chat /effect @p instant_health 1 10")
+        for name, x, y, z in layout.entities:
+            commands.append(f"chat /summon {name.lower()} {x} {y} {z}")
+
+        for command in commands:
+            self.agent_host.sendCommand(command)
+
+        # Wait until the refilled inventory shows up in the observations.
+        self.synchronizer.begin()
+        deadline = time.time() + self.synchronizer.timeout
+        while True:
+            world_state = self.synchronizer.wait()
+            frame = self.synchronizer.frame
+            if not world_state.is_mission_running:
+                return None
+            if frame is not None and frame.inventory_slot_0_size == self.block_quantity:
+                break
+            if time.time() > deadline:
+                return None
+            self.synchronizer.begin()
+
+        self.episode_layout = layout
+        return world_state
+
+    def quit_mission(self) -> None:
+        """Ends the running mission, if any, so a new one can be started.
+        Only soft reset missions outlive their episode."""
+        if not self.soft_reset or self.client_lost:
+            return
+        world_state = self.agent_host.peekWorldState()
+        if world_state.is_mission_running:
+            self.agent_host.sendCommand("quit")
+        deadline = time.time() + self.synchronizer.timeout
+        while world_state.is_mission_running and time.time() < deadline:
+            time.sleep(self.synchronizer.latency_target)
+            world_state = self.agent_host.getWorldState()
+
+    def step_reward_blocks(self, frame: Optional[ObservationFrame], reward_mult: int = 1) -> int:
         """Mutates self.last_block_count.
         Returns positive value based on how many blocks were placed in last iteration."""
-        observations = self.extract_obs_running(world_state)
-        if observations is None or observations['Life'] <= 0:
+        if frame is None or frame.life <= 0:
             return 0
         
-        blocks_used = self.block_quantity - observations['InventorySlot_0_size']
+        blocks_used = self.block_quantity - frame.inventory_slot_0_size
         reward = 0
 
         if blocks_used > self.last_block_count:
@@ -233,59 +779,25 @@ class SteveTheBuilder(gym.Env):
 
         return reward
     
-    def is_facing_ghast(self, world_state) -> Optional[bool]:
+    def is_facing_ghast(self, frame: Optional[ObservationFrame]) -> Optional[bool]:
         """Whether or not the agent is looking in the direction (left-right plane)
         of a Ghast.
         
         Returns None if unable to find both Steve and the Ghast, or if mission
         is not running."""
-        # Get Entities observation
-        observations = self.extract_obs_running(world_state)
-        if observations is None:
+        if frame is None:
             return None
-        entitySight = observations["entitySight"]
-        found_steve = False
-        found_ghast = False
-
-        for entity in entitySight:
-            id = entity['id']
-            name = entity['name']
-
-            if name == "SteveTheBuilder":
-                x_steve = entity["x"]
-                z_steve = entity["z"]
-                yaw_steve = entity["yaw"]
-                found_steve = True
-            
-            elif name == mob_type:
-                x_ghast = entity["x"]
-                z_ghast = entity["z"]
-                yaw_ghast = entity["yaw"]
-                found_ghast = True
-        
-        if (found_steve and found_ghast):
-            # Find the yaw the agent need to be for looking at the ghast
-            hypothenus_distance = math.sqrt( (x_steve-x_ghast)**2 + (z_steve-z_ghast)**2 )
-            adjacent_distance = abs(x_ghast-x_steve)
-            alpha = math.degrees(math.acos(adjacent_distance/hypothenus_distance))
-            if z_ghast > z_steve:
-                if(x_ghast>x_steve):
-                    yaw = 270 + alpha
-                else:
-                    yaw = 90 - alpha                
+        self.entities.observe(frame)
+        ghast = self.entities.first(self.mob_type)
 
-            else:
-                if(x_ghast>x_steve):
-                    yaw = 270 - alpha
-                else:
-                    yaw = 90 + alpha
+        if self.entities.agent is not None and ghast is not None:
+            return bool(self.entities.facing()[ghast])
+        return None
 
-            return yaw<=yaw_steve+70 and yaw>=yaw_steve-70
 
-
-    def step_reward_facing_ghast(self,world_state) -> int:
+    def step_reward_facing_ghast(self, frame: Optional[ObservationFrame]) -> int:
         reward = 0
-        is_facing = self.is_facing_ghast(world_state)
+        is_facing = self.is_facing_ghast(frame)
 
         if is_facing is not None:
             if is_facing:
@@ -299,77 +811,138 @@ class SteveTheBuilder(gym.Env):
         return reward
 
 
-    def step_reward_damage(self, world_state) -> int:
+    def step_reward_shelter(self, frame: Optional[ObservationFrame]) -> float:
+        """Mutates self.shelter, self.episode_shelter_coverage and self.last_enclosure.
+        Returns the fraction of the Ghasts in sight whose line of sight to the
+        agent goes through blocks it placed."""
+        if frame is None:
+            return 0
+        self.shelter.observe(frame)
+        self.entities.observe(frame)
+        covered = self.shelter.coverage(self.entities, self.mob_type)
+        coverage = np.count_nonzero(covered) / len(covered) if len(covered) else 0.0
+        self.episode_shelter_coverage += coverage
+        self.last_enclosure = self.shelter.enclosure(frame.position)
+        return coverage
+
+    def step_reward_damage(self, frame: Optional[ObservationFrame]) -> int:
         """Mutates self.last_damage_taken.
         Returns negative value based on how much damage taken."""
-        observations = self.extract_obs_running(world_state)
-        if observations is None:
+        if frame is None:
             return 0
 
         # DamageTaken observation resets only when launchClient.bat is restarted,
-        # however, self.last_damage_taken resets every time main.py is run,
-        # so only calculate reward for damage taken after the first few steps.
-        new_damage_taken = observations['DamageTaken']
+        # so it is re-based on the first observation after a client starts
+        # serving this environment. A lower value means the client restarted
+        # unnoticed, which re-bases it here.
+        new_damage_taken = frame.damage_taken
+        if new_damage_taken < self.last_damage_taken:
+            self.last_damage_taken = new_damage_taken
         self.episode_damage_taken += (new_damage_taken - self.last_damage_taken)
-        
-        if len(self.steps) <= 1 and self.episode_step < 7:
-            reward = 0
-        else:
-            reward = - ((new_damage_taken - self.last_damage_taken) // 4)
+        reward = - ((new_damage_taken - self.last_damage_taken) // 4)
         self.last_damage_taken = new_damage_taken
 
         return reward
 
-    def step_reward(self, world_state) -> float:
+    def step_reward(self, rewards, frame: Optional[ObservationFrame]) -> float:
         """Mutates self.episode_return (adds on rewards since last world state was taken).
-        Returns rewards since last world state was taken."""
+        Returns rewards since last world state was taken.
+
+        Every term reads the same decoded frame, so they all agree on the
+        world state being rewarded.
+
+        Args
+            rewards: <list> Malmo rewards received since the last step
+            frame: <ObservationFrame> observation the step is rewarded on
+        """
         reward = 0
-        for r in world_state.rewards:
+        for r in rewards:
             reward += r.getValue()
         blocks_placed = False
         facing_ghast = False
-        reward += self.step_reward_damage(world_state)
-        if reward_blocks:
-            if self.step_reward_blocks(world_state):
+        with self.profiler.section("reward_damage"):
+            reward += self.step_reward_damage(frame)
+        if self.reward_blocks:
+            with self.profiler.section("reward_blocks"):
+                block_reward = self.step_reward_blocks(frame, self.reward_mult)
+            if block_reward:
                 blocks_placed = True
-            reward += self.step_reward_blocks(world_state)
-        if reward_facing_ghast:
-            if self.step_reward_facing_ghast(world_state):
+            reward += block_reward
+        if self.reward_facing_ghast:
+            with self.profiler.section("reward_facing_ghast"):
+                facing_reward = self.step_reward_facing_ghast(frame)
+            if facing_reward:
                 facing_ghast = True
-            reward += self.step_reward_facing_ghast(world_state)
+            reward += facing_reward
+        if self.track_shelter:
+            with self.profiler.section("reward_shelter"):
+                shelter_coverage = self.step_reward_shelter(frame)
+            if self.reward_shelter:
+                reward += shelter_coverage
         if blocks_placed and facing_ghast:
             self.last_correct_position_block += 1
             reward += 2
         self.episode_return += reward
         return reward
 
+    def rejects(self, command: str) -> bool:
+        """Whether step_action drops the command."""
+        # limiting agent to only looking down or up (ground block layer and 1 above that)
+        looking_too_far_down = command == "look 1" and self.looking_down
+        looking_too_far_up = command == "look -1" and not self.looking_down
+        return looking_too_far_down or looking_too_far_up
+
+    def valid_actions(self) -> np.ndarray:
+        """Returns the action mask, 1 for the discrete actions step_action carries out."""
+        return np.array([not self.rejects(command) for command in self.action_dict.values()], dtype=np.float32)
+
+    def observation(self, obs: np.ndarray):
+        """Returns the observation array as the observation space has it."""
+        if self.action_mask:
+            return {'action_mask': self.valid_actions(), 'observations': obs}
+        return obs
+
+    def accept_action(self, command: str) -> bool:
+        """Mutates self.looking_down.
+        Returns whether the command is carried out."""
+        if self.rejects(command):
+            return False
+        if command in ("look 1", "look -1"):
+            # if the agent inputs a down command, it must be the case the agent
+            # is not looking down. And vice-versa.
+            self.looking_down = not self.looking_down
+        return True
+
     def step_action(self, action):
         command = self.action_dict[action]
 
-        # limiting agent to only looking down or up (ground block layer and 1 above that)
-        down_cmd = command == "look 1"
-        up_cmd = command == "look -1"
-        looking_too_far_down = down_cmd and self.looking_down
-        looking_too_far_up = up_cmd and not self.looking_down
-
-        if not (looking_too_far_down or looking_too_far_up):
-            if down_cmd or up_cmd:
-                # if the agent inputs a down command, it must be the case the agent
-                # is not looking down. And vice-versa.
-                self.looking_down = not self.looking_down
-            self.agent_host.sendCommand(command)
-            time.sleep(.2)
+        if self.accept_action(command):
+            self.synchronizer.send([command])
+            self.wait_for_action()
             self.episode_step += 1
+            self.episode_commands += 1
+        elif self.step_sync != "legacy":
+            # A forced poll of a dropped action: nothing is sent, but the
+            # rewards of the previous step must not be counted again.
+            self.synchronizer.begin()
 
     def step_continuous_action(self, action: List[float]) -> None:
         turn_val, pitch_val, use_val = action
         use_val = 1 if use_val > 0 else 0
-        self.agent_host.sendCommand(f'turn {turn_val}')
-        self.agent_host.sendCommand(f'pitch {pitch_val}')
-        self.agent_host.sendCommand(f'use {use_val}')
+        self.synchronizer.send([f'turn {turn_val}', f'pitch {pitch_val}', f'use {use_val}'])
 
-        time.sleep(.2)
+        self.wait_for_action()
         self.episode_step += 1
+        self.episode_commands += 3
+
+    def wait_for_action(self) -> None:
+        """Lets the commands just sent take effect before observing."""
+        with self.profiler.section("wait_for_action"):
+            if self.step_sync == "legacy":
+                # 0.2 seconds is 4 ticks at Minecraft's default tick rate.
+                time.sleep(.2 * self.action_repeat * self.ms_per_tick / 50)
+            else:
+                self.synchronizer.begin()
 
     def step(self, action):
         """
@@ -382,8 +955,21 @@ class SteveTheBuilder(gym.Env):
             observation: <np.array> flattened array of obseravtion
             reward: <int> reward from taking action
             done: <bool> indicates terminal state
-            info: <dict> dictionary of extra information
+            info: <dict> dictionary of extra information, with "client_lost"
+                True when the episode ended because the client hung rather than
+                in the game, so the step is not a real terminal state
         """
+        step_start = time.perf_counter()
+
+        # A dropped action changes nothing in the world, so it skips the
+        # client and the step returns the previous observation.
+        if self.discrete_moves and self.rejects(self.action_dict[action]):
+            self.rejected_streak += 1
+            if self.rejected_streak < self.rejected_action_poll_every:
+                if self.recorder is not None:
+                    self.recorder.append(REJECTED, self.frame, action)
+                return self.observation(self.obs), 0, False, dict()
+        self.rejected_streak = 0
 
         if self.discrete_moves:
             self.step_action(action)
@@ -391,43 +977,101 @@ class SteveTheBuilder(gym.Env):
             self.step_continuous_action(action)
 
         # Get Observation
-        world_state = self.agent_host.getWorldState()
-        for error in world_state.errors:
-            print("Error:", error.text)
-        self.obs = self.get_observation(world_state)
+        with self.profiler.section("wait_for_observation"):
+            if self.step_sync == "legacy":
+                world_state = self.agent_host.getWorldState()
+                for error in world_state.errors:
+                    print("Error:", error.text)
+                rewards = world_state.rewards
+            else:
+                world_state = self.synchronizer.wait()
+                rewards = self.synchronizer.rewards
+                if self.synchronizer.timed_out and world_state.is_mission_running:
+                    self.hung_steps += 1
+                else:
+                    self.hung_steps = 0
+        with self.profiler.section("get_observation"):
+            self.obs = self.get_observation(world_state)
 
         # Get Done
         done = not world_state.is_mission_running
+        if self.soft_reset:
+            # The mission outlives the episode, so the env enforces the
+            # command quota and ends the episode when the agent dies.
+            done = done or self.episode_commands >= self.max_episode_steps or \
+                (self.frame is not None and self.frame.life <= 0)
+        info = dict()
+        if self.hung_steps >= self.client_hang_steps:
+            # End the episode, the next one starts on a healthy client. The
+            # observation is stale, so the step is flagged for the trainer to
+            # leave it out.
+            self.supervisor.report_failure(self.client, f"no observation for {self.hung_steps} steps")
+            self.client_lost = True
+            done = True
+            info['client_lost'] = True
 
         # Get Reward
-        reward = self.step_reward(world_state)
-        
-        return self.obs, reward, done, dict()
+        reward = self.step_reward(rewards, self.frame)
+
+        # Start loading the next episode's mission on the standby client.
+        if not done and self.should_start_standby_mission():
+            self.standby.start(self.get_mission_xml())
+
+        if self.recorder is not None:
+            malmo_reward = sum(r.getValue() for r in rewards)
+            self.recorder.append(STEP, self.frame, action, malmo_reward, reward, done)
+
+        self.profiler.record("step", time.perf_counter() - step_start)
+        return self.observation(self.obs), reward, done, info
 
     def get_enemy_xml(self, x, y, z) -> str:
         # for mob types, see:
         # https://microsoft.github.io/malmo/0.30.0/Schemas/Types.html#type_EntityTypes
-        mob_type_xml = mob_type  
+        mob_type_xml = self.mob_type  
         return f"<DrawEntity x='{x}' y='{y}' z='{z}' type='{mob_type_xml}'/>"
 
     def get_mission_xml(self):
-        if problem_type is ProblemType.flat:
-            if random_spawn:
+        """Returns the XML of a mission with a new random spawn. The XML is
+        built once per spawn and reused, and once the terrain of the problem
+        type is cached, starts from the saved world instead of drawing it."""
+        if self.problem_type is ProblemType.flat:
+            if self.random_spawn:
                 x = self.enemy_spawn_distance if randint(2) else -self.enemy_spawn_distance
                 z = self.enemy_spawn_distance if randint(2) else -self.enemy_spawn_distance
             else:
                 x = self.enemy_spawn_distance
                 z = self.enemy_spawn_distance
-        
-        if problem_type is ProblemType.hill:
+            spawn = (x, z)
+
+        if self.problem_type is ProblemType.hill:
+            spawn = (randint(2, 22), )
+
+        world_file = self.terrain_cache.world_file(self.problem_type.name) if self.terrain_cache is not None else None
+        key = (self.problem_type, spawn, world_file)
+        if key not in self.mission_xml_cache:
+            self.mission_xml_cache[key] = self.build_mission_xml(spawn, world_file)
+        return self.mission_xml_cache[key]
+
+    def build_mission_xml(self, spawn, world_file: Optional[str] = None) -> str:
+        """
+        Returns the XML of a mission.
+
+        Args
+            spawn: <tuple> Ghast (x, z) offset for flat worlds, agent y for hills
+            world_file: <str> saved world to start from instead of drawing the terrain
+        """
+        if self.problem_type is ProblemType.flat:
+            x, z = spawn
+
+        if self.problem_type is ProblemType.hill:
             x = self.enemy_spawn_distance
             z = self.enemy_spawn_distance
         enemy_starting_location = (x, 1, z)
 
-        if problem_type is ProblemType.flat:
+        if self.problem_type is ProblemType.flat:
             draw_terrain = "<DrawCuboid x1='{}' x2='{}' y1='2' y2='30' z1='{}' z2='{}' type='air'/>".format(-self.size, self.size, -self.size, self.size) +  "<DrawCuboid x1='{}' x2='{}' y1='1' y2='1' z1='{}' z2='{}' type='stone'/>".format(-self.size, self.size, -self.size, self.size)
             agent_spawn = f'<Placement x="0" y="2" z="0" pitch="45" yaw="0"/>'
-        elif problem_type is ProblemType.hill:
+        elif self.problem_type is ProblemType.hill:
             # clear out extra space to try to remove any Ghasts that go really
             # far
             air_size = self.size * 2
@@ -435,7 +1079,7 @@ class SteveTheBuilder(gym.Env):
             for i in range(1, 21):
                 layer_size = 21 - i
                 draw_terrain += f"<DrawCuboid x1='{-layer_size}' x2='{layer_size}' y1='1' y2='{i}' z1='{-layer_size}' z2='{layer_size}' type='{self.player_block}'/>"
-            agent_spawn_y = randint(2, 22)
+            agent_spawn_y, = spawn
             agent_spawn_z = 22 - agent_spawn_y
             agent_spawn = f'<Placement x="0" y="{agent_spawn_y}" z="{agent_spawn_z}" pitch="45" yaw="0"/>'
             enemy_starting_location = (x+y for x, y in zip(enemy_starting_location, (1, agent_spawn_y, agent_spawn_z)))
@@ -445,9 +1089,48 @@ class SteveTheBuilder(gym.Env):
         else:
             movement = "<ContinuousMovementCommands/>"
 
+        if self.soft_reset:
+            # Episodes are reset through chat commands, and their length is
+            # counted by the env since the mission spans many of them.
+            movement += "<ChatCommands/><MissionQuitCommands/>"
+            command_quota = ""
+        else:
+            command_quota = f'<AgentQuitFromReachingCommandQuota total="{self.max_episode_steps}" />'
+
+        if world_file is not None:
+            world_generator = f'<FileWorldGenerator src="{world_file}" forceReset="true"/>'
+            draw_terrain = ""
+        else:
+            world_generator = '<FlatWorldGenerator generatorString="3;7,2;1;"/>'
+            if self.terrain_cache is not None and not self.soft_reset:
+                # The world is saved through chat commands.
+                movement += "<ChatCommands/>"
+
+
+        if self.observation_profile == "lean":
+            inventory_observation = "<ObservationFromHotBar/>"
+            ray_observation = ""
+            entity_range = (self.entity_range, ) * 3
+            # Only the Ghast facing reward, the Ghast coordinates and the
+            # shelter coverage use entities.
+            if not (self.reward_facing_ghast or self.obs_ghast_coordinate or self.track_shelter):
+                entity_range = None
+        else:
+            inventory_observation = "<ObservationFromFullInventory/>"
+            ray_observation = "<ObservationFromRay/>"
+            entity_range = (15, 25, 50)
+        entity_observation = ""
+        if entity_range is not None:
+            entity_observation = f'''<ObservationFromNearbyEntities>
+                                <Range name="entitySight" xrange="{entity_range[0]}" yrange="{entity_range[1]}" zrange="{entity_range[2]}" />
+                            </ObservationFromNearbyEntities>'''
+
+        mod_settings = ""
+        if self.ms_per_tick != 50:
+            mod_settings = f"<ModSettings><MsPerTick>{self.ms_per_tick}</MsPerTick></ModSettings>"
 
         time_reward = "<RewardForTimeTaken initialReward='1' delta='1' density='PER_TICK' />"
-        obs_low_y = -1
+        obs_low_y = self.obs_low_y
         obs_high_y = 1
 
         assert self.obs_height == obs_high_y - obs_low_y + 1, f"SteveTheBuilder.get_mission_xml: [self.obs_height] value of {self.obs_height} is not equal to {obs_high_y - obs_low_y + 1}, which is [obs_high_y] - [obs_low_y] + 1."
@@ -458,6 +1141,7 @@ class SteveTheBuilder(gym.Env):
                     <About>
                         <Summary>SteveTheBuilder</Summary>
                     </About>
+                    ''' + mod_settings + '''
 
                     <ServerSection>
                         <ServerInitialConditions>
@@ -468,7 +1152,7 @@ class SteveTheBuilder(gym.Env):
                             <Weather>clear</Weather>
                         </ServerInitialConditions>
                         <ServerHandlers>
-                            <FlatWorldGenerator generatorString="3;7,2;1;"/>
+                            ''' + world_generator + '''
                             <DrawingDecorator>''' + \
                                 draw_terrain + \
                                 f"{self.get_enemy_xml(*enemy_starting_location)}" + \
@@ -490,19 +1174,15 @@ class SteveTheBuilder(gym.Env):
                         <AgentHandlers>''' + \
                             movement + \
                             '''<ObservationFromFullStats/>
-                            <ObservationFromFullInventory/>
-                            <ObservationFromRay/>
+                            ''' + inventory_observation + ray_observation + '''
                             <ObservationFromGrid>
                                 <Grid name="nearbyVolume">''' + \
                                     f'<min x="-{str(int(self.obs_size/2))}" y="{obs_low_y}" z="-{str(int(self.obs_size/2))}"/>' + \
                                     f'<max x="{str(int(self.obs_size/2))}" y="{obs_high_y}" z="{str(int(self.obs_size/2))}"/>' + \
                                 '''</Grid>
                             </ObservationFromGrid>
-                            <ObservationFromNearbyEntities>
-                                <Range name="entitySight" xrange="15" yrange="25" zrange="50" />
-                            </ObservationFromNearbyEntities>
-                            
-                            <AgentQuitFromReachingCommandQuota total="'''+str(self.max_episode_steps)+'''" />
+                            ''' + entity_observation + '''
+                            ''' + command_quota + '''
                             <AgentQuitFromTouchingBlockType>
                                 <Block type="bedrock" />
                             </AgentQuitFromTouchingBlockType>''' + time_reward + '''
@@ -514,34 +1194,100 @@ class SteveTheBuilder(gym.Env):
         """
         Initialize new malmo mission.
         """
-        my_mission = MalmoPython.MissionSpec(self.get_mission_xml(), True)
+        mission_xml = self.get_mission_xml()
+        self.mission_layout = self.episode_layout = self.parse_mission(mission_xml)
+        self.client, world_state = self.supervisor.start(lambda client: self.start_supervised_mission(client, mission_xml))
+
+        # Save the terrain this mission drew for the next ones.
+        if self.terrain_cache is not None and self.mission_layout.world_file is None:
+            if not self.terrain_cache.save(self.problem_type.name, self.mission_layout, self.agent_host):
+                self.terrain_cache = None
+        return world_state
+
+    def start_supervised_mission(self, client, mission_xml: str):
+        """
+        Starts a mission on a client picked by self.supervisor, switching to a
+        new agent host if the client changed or the current one failed.
+
+        Args
+            client: <ClientAssignment> client to run the mission on
+            mission_xml: <str> mission to start
+
+        Returns
+            world_state: <object> world state once the mission began
+        """
+        if client is not self.client or self.client_lost:
+            action = "switched to" if client is not self.client else "reconnecting to"
+            self.agent_host = self.synchronizer.agent_host = self.create_agent_host(self.sim_seed)
+            self.client = client
+            self.client_lost = False
+            self.rebase_damage_taken = True
+            print(f"SteveTheBuilder {action} Minecraft client {self.client}")
+        try:
+            return self.start_mission(self.agent_host, client, mission_xml)
+        except ClientError:
+            self.client_lost = True
+            raise
+
+    def parse_mission(self, mission_xml: str):
+        """Returns the MissionLayout of a mission XML, including the terrain
+        of the saved world it starts from, if any."""
+        layout = parse_mission_xml(mission_xml)
+        if layout.world_file is not None:
+            self.terrain_cache.restore_terrain(self.problem_type.name, layout)
+        return layout
+
+    def start_mission(self, agent_host, client, mission_xml: str):
+        """
+        Starts a mission on a Minecraft client and waits for it to begin.
+        Runs on the standby thread for pipelined resets, so it must not touch
+        the episode's state.
+
+        Args
+            agent_host: <object> agent host to start the mission with
+            client: <ClientAssignment> client to run the mission on
+            mission_xml: <str> mission to start
+
+        Returns
+            world_state: <object> world state once the mission began
+
+        Raises
+            ClientError: the client refused the mission, or it did not begin
+                within self.mission_start_timeout seconds
+        """
+        start = time.perf_counter()
+        my_mission = self.malmo.MissionSpec(mission_xml, True)
         # my_mission.forceWorldReset();
-        my_mission_record = MalmoPython.MissionRecordSpec()
-        my_mission.requestVideo(1200, 720)
-        my_mission.setViewpoint(1)
+        my_mission_record = self.malmo.MissionRecordSpec()
+        if self.observation_profile == "full":
+            my_mission.requestVideo(1200, 720)
+            my_mission.setViewpoint(1)
 
         max_retries = 3
-        my_clients = MalmoPython.ClientPool()
-        my_clients.add(MalmoPython.ClientInfo('127.0.0.1', 10000)) # add Minecraft machines here as available
+        my_clients = self.malmo.ClientPool()
+        my_clients.add(self.malmo.ClientInfo(client.host, client.port))
 
         for retry in range(max_retries):
             try:
-                self.agent_host.startMission( my_mission, my_clients, my_mission_record, 0, 'SteveTheBuilder' )
+                agent_host.startMission( my_mission, my_clients, my_mission_record, client.role, client.experiment_id )
                 break
             except RuntimeError as e:
                 if retry == max_retries - 1:
-                    print("Error starting mission:", e)
-                    exit(1)
+                    raise ClientError(f"Error starting mission: {e}") from e
                 else:
                     time.sleep(2)
 
-        world_state = self.agent_host.getWorldState()
+        deadline = time.time() + self.mission_start_timeout
+        world_state = agent_host.getWorldState()
         while not world_state.has_mission_begun:
+            if time.time() > deadline:
+                raise ClientError(f"Mission did not begin within {self.mission_start_timeout} seconds.")
             time.sleep(0.1)
-            world_state = self.agent_host.getWorldState()
+            world_state = agent_host.getWorldState()
             for error in world_state.errors:
                 print("\nError:", error.text)
 
+        self.profiler.record("start_mission", time.perf_counter() - start)
         return world_state
         
 
@@ -553,6 +1299,11 @@ class SteveTheBuilder(gym.Env):
         grid around the agent. Dimensions are [self.obs_height]
         and [self.obs_size], 3 x 5 x 5 may be deprecated.
 
+        Mutates self.frame to the observation frame the returned observation
+        was built from (None if the mission ended first). With "event" or
+        "async" step synchronization the world state must already have been
+        waited on.
+
         The agent is in the center square facing up.
         Search "<Grid name="nearbyVolume">" in mission XML to find specifics.
             Note that y is relative to the agent.
@@ -563,162 +1314,128 @@ class SteveTheBuilder(gym.Env):
         Returns
             observation: <np.array> the state observation
         """
-        obs_tmp = self.obs_array_length()
-        obs = np.zeros((obs_tmp, ))
-
-        while world_state.is_mission_running:
-            time.sleep(0.1)
-            world_state = self.agent_host.getWorldState()
-            if len(world_state.errors) > 0:
-                raise AssertionError('Could not load grid.')
-
-            if world_state.number_of_observations_since_last_state > 0:
-                # First we get the json from the observation API
-                observations = self.extract_observations(world_state)
-
-                # Get grid observation
-                grid = observations.get('nearbyVolume')
-
-                # avoid KeyError issue by checking if observations has values.
-                if grid is None:
-                    print(f"Encountered a KeyError issue on step {self.steps[-1]}.")
+        self.frame = None
+
+        if self.step_sync == "legacy":
+            while world_state.is_mission_running:
+                time.sleep(0.1)
+                world_state = self.agent_host.getWorldState()
+                if len(world_state.errors) > 0:
+                    raise AssertionError('Could not load grid.')
+
+                # First we decode the json from the observation API, once.
+                self.frame = ObservationFrame.from_world_state(world_state)
+                if self.frame is not None:
                     break
-                for i, x in enumerate(grid):
-                    obs[i] = x == self.player_block
+        else:
+            # The synchronizer already waited for (and decoded) the
+            # observation that follows the last action.
+            self.frame = self.synchronizer.frame
+
+        if self.frame is not None:
+            self.episode_payload_bytes += self.frame.payload_size
+            self.episode_payload_frames += 1
+
+        return self.encode_observation(self.frame)
+
+    def encode_observation(self, frame: Optional[ObservationFrame]):
+        """Returns the flattened observation array for a decoded frame, all
+        zeros if there is no frame."""
+        # A new array every step, RLlib keeps the observations it is given.
+        obs = np.zeros(self.obs_array_length(), dtype=np.float32)
+        if frame is None:
+            return obs
+
+        # Get grid observation
+        grid = frame.nearby_volume
+
+        # avoid KeyError issue by checking if observations has values.
+        if grid is None:
+            print(f"Encountered a KeyError issue on step {self.stats.last('step')}.")
+            return obs
+
+        yaw = frame.yaw
+        # from https://edstem.org/us/courses/14172/discussion/863158 suggestion in comments
+        if yaw < 0:
+            yaw += 360
+
+        # Rotate observation with orientation of agent
+        turns = quarter_turns(yaw) if self.yaw_obs_simplifier else 0
+        self.grid_encoder.encode(grid, obs[:self.grid_encoder.length], turns)
+
+        # decrement this by 1 every time used, so no overwriting other information
+        extra_val_index = -1
+
+        if not self.yaw_obs_simplifier:
+            # make yaw a decimal value so fits inside observation space box.
+            obs[extra_val_index] = yaw/360
+            extra_val_index -= 1
+
+            if self.reward_facing_ghast:
+                ghast_index = extra_val_index
+                extra_val_index -= 1
+                        
+                facing_ghast = self.is_facing_ghast(frame)
+                if facing_ghast is not None:
+                    obs[ghast_index] = 1 if facing_ghast else 0
+                        
+            # TODO coordinate code probably needs to be relative to the agent.
+            # Imagine if the Ghast is in a certain location. The agent
+            # could be in many different locations relatively, and this changes
+            # the situation pretty drastically. However, there is no change
+            # in observation.
+            if self.obs_ghast_coordinate:
+                self.entities.observe(frame)
+                ghast = self.entities.first(self.mob_type)
+
+                if ghast is not None:
+                    x, y, z = self.entities.positions[ghast] / 2
+                    obs[extra_val_index] = x
+                    extra_val_index -= 1
 
-                yaw = observations['Yaw']
-                # from https://edstem.org/us/courses/14172/discussion/863158 suggestion in comments
-                if yaw < 0:
-                    yaw += 360
+                    obs[extra_val_index] = y
+                    extra_val_index -= 1
 
-                # decrement this by 1 every time used, so no overwriting other information
-                extra_val_index = -1
+                    obs[extra_val_index] = z
+                    extra_val_index -= 1
+                    #print("coordinates:",entity["x"],entity["y"],entity["z"])
 
-                if yaw_obs_simplifier:
-                    # Rotate observation with orientation of agent
-                    obs = obs.reshape((self.obs_height, self.obs_size, self.obs_size))
+            if self.obs_pitch:
+                pitch = frame.pitch
 
-                    if yaw >= 225 and yaw < 315:
-                        obs = np.rot90(obs, k=1, axes=(1, 2))
-                    elif yaw >= 315 or yaw < 45:
-                        obs = np.rot90(obs, k=2, axes=(1, 2))
-                    elif yaw >= 45 and yaw < 135:
-                        obs = np.rot90(obs, k=3, axes=(1, 2))
+                obs[extra_val_index] = pitch/90
+                extra_val_index -= 1
+        return obs
 
-                    obs = obs.flatten()
-                else:
-                    # make yaw a decimal value so fits inside observation space box.
-                    obs[extra_val_index] = yaw/360
-                    extra_val_index -= 1
+    def episode_stats(self, n: int = None):
+        """
+        Returns the mean statistics of the last n episodes, for the trainer
+        to collect cheaply, e.g. through
+        trainer.workers.foreach_worker(lambda w: w.foreach_env(lambda env: env.episode_stats(100))).
 
-                    if reward_facing_ghast:
-                        ghast_index = extra_val_index
-                        extra_val_index -= 1
-                        
-                        facing_ghast = self.is_facing_ghast(world_state)
-                        if facing_ghast is not None:
-                            obs[ghast_index] = 1 if facing_ghast else 0
-                        
-                    # TODO coordinate code probably needs to be relative to the agent.
-                    # Imagine if the Ghast is in a certain location. The agent
-                    # could be in many different locations relatively, and this changes
-                    # the situation pretty drastically. However, there is no change
-                    # in observation.
-                    if obs_ghast_coordinate:
-                        ghast_coordinate = observations["entitySight"]
-
-                        for entity in ghast_coordinate:
-                            if entity['name'] == mob_type:
-                                obs[extra_val_index] = entity["x"]/2
-                                extra_val_index -= 1
-
-                                obs[extra_val_index] = entity["y"]/2
-                                extra_val_index -= 1
-
-                                obs[extra_val_index] = entity["z"]/2
-                                extra_val_index -= 1
-                                #print("coordinates:",entity["x"],entity["y"],entity["z"])
-                                break
-
-                    if obs_pitch:
-                        pitch = observations["Pitch"]
-
-                        obs[extra_val_index] = pitch/90
-                        extra_val_index -= 1
-                break
-        return obs
+        Args
+            n: <int> number of episodes, all that are kept if None
+        """
+        return self.stats.aggregate(n)
 
     def log_returns(self):
         """
-        Log the current returns as a graph and text file
-
-        Args:
-            steps (list): list of global steps after each episode
-            returns (list): list of total return of each episode
+        Renders the graphs of the metrics logged so far in a background
+        process, writes the step profile of this worker if profiling, and
+        prints the recent observation payload size.
         """
-        # Plot Blocks Placed Graph
-        plt.clf()
-        plt.plot(self.steps[1:], self.blocks_placed[1:])
-        plt.title('SteveTheBuilder')
-        plt.ylabel('Number Of Blocks Placed')
-        plt.xlabel('Steps')
-        plt.savefig('blocks.png')
-        
-        # Damage Taken Graph
-        plt.clf()
-        plt.plot(self.steps[2:], self.damage_taken[2:])
-        plt.title('SteveTheBuilder')
-        plt.ylabel('Damage Taken')
-        plt.xlabel('Steps')
-        plt.savefig('damage.png')
-
-        # Face Ghast Graph
-        plt.clf()
-        plt.plot(self.steps[1:], self.face_ghast_count[1:])
-        plt.title('SteveTheBuilder')
-        plt.ylabel('Number Of Blocks Placed')
-        plt.xlabel('Steps')
-        plt.savefig('faceGhast.png')
-
-        # Correct position of block
-        plt.clf()
-        plt.plot(self.steps[1:], self.correct_position_block[1:])
-        plt.title('SteveTheBuilder')
-        plt.ylabel('Correct position of block')
-        plt.xlabel('Steps')
-        plt.savefig('correctPosition.png')
-
-        # Plot Rewards Graphs
-        box = np.ones(self.log_frequency) / self.log_frequency
-        returns_smooth = np.convolve(self.returns[1:], box, mode='same')
-        plt.clf()
-        plt.plot(self.steps[1:], returns_smooth)
-        plt.title('SteveTheBuilder')
-        plt.ylabel('Return')
-        plt.xlabel('Steps')
-        plt.savefig('returns.png')
-
-        with open('returns.txt', 'w') as f:
-            for step, value in zip(self.steps[1:], self.returns[1:]):
-                f.write("{}\t{}\n".format(step, value)) 
-    
+        self.metrics.start_plotting()
+
+        if self.profiler.enabled and self.profile_file is not None:
+            path, extension = os.path.splitext(self.profile_file)
+            self.profiler.dump(f"{path}-{self.client.slot}{extension}")
+
+        payload_size = self.stats.aggregate(self.log_frequency)['payload_size']
+        print(f"Observation payload: {payload_size:.0f} bytes per tick ({self.observation_profile} profile)")
+
+
 if __name__ == '__main__':
-    ray.init()
-    
-    if discrete_moves:
-        trainer = dqn.DQNTrainer(env=SteveTheBuilder, config={
-            'env_config': {},           # No environment parameters to configure
-            'framework': 'torch',       # Use pyotrch instead of tensorflow
-            'num_gpus': 0,              # We aren't using GPUs
-            'num_workers': 0            # We aren't using parallelism
-        })
-    else:
-        trainer = ppo.PPOTrainer(env=SteveTheBuilder, config={
-        'env_config': {},           # No environment parameters to configure
-        'framework': 'torch',       # Use pyotrch instead of tensorflow
-        'num_gpus': 0,              # We aren't using GPUs
-        'num_workers': 0            # We aren't using parallelism
-        })
-
-    while True:
-        print(trainer.train())
+    # The trainer lives in train.py, so rollout workers importing this
+    # module to build environments never import it.
+    import train
+    train.train()
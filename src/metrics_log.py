@@ -0,0 +1,118 @@
+import collections
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# One record per episode, appended to the metrics file as raw bytes.
+EPISODE_DTYPE = np.dtype([
+    ('step', np.int64),
+    ('episode_return', np.float32),
+    # Moving average of the returns over the last window episodes.
+    ('return_avg', np.float32),
+    ('blocks_placed', np.int32),
+    ('damage_taken', np.int32),
+    ('face_ghast_count', np.int32),
+    ('correct_position_block', np.int32),
+    ('shelter_coverage', np.float32),
+    ('enclosure', np.float32),
+    # Mean observation JSON bytes per tick.
+    ('payload_size', np.float32),
+])
+
+PLOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plot_metrics.py")
+
+
+class MovingAverage:
+    """Mean of the last window values, updated in constant time."""
+
+    def __init__(self, window: int):
+        self.values = collections.deque(maxlen=window)
+        self.total = 0.0
+
+    def add(self, value: float) -> float:
+        """Adds a value and returns the mean of the window."""
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        return self.total / len(self.values)
+
+
+class MetricsWriter:
+    """Append-only log of episode metrics.
+
+    Every episode costs one fixed-size binary record, plus a line of the
+    "step<TAB>return" text file, whatever the length of the run. Graphs are
+    rendered from the file by plot_metrics.py in a separate process, so
+    logging never waits on matplotlib.
+
+    With resume, the files of the previous run are appended to instead, see
+    truncate()."""
+
+    def __init__(self, path: str, returns_path: str = None, window: int = 10, suffix: str = "", resume: bool = False):
+        self.path = path
+        self.returns_path = returns_path
+        # Appended to the graph file names.
+        self.suffix = suffix
+        self.return_average = MovingAverage(window)
+        self.record = np.zeros(1, dtype=EPISODE_DTYPE)
+        self.plot_process = None
+
+        with open(path + ".json", 'w') as f:
+            json.dump({'dtype': EPISODE_DTYPE.descr, 'window': window}, f)
+        # Each run starts the files over, as returns.txt always did.
+        self.file = open(path, 'ab' if resume else 'wb')
+        self.returns_file = open(returns_path, 'a' if resume else 'w') if returns_path is not None else None
+
+    def append(self, **fields) -> None:
+        """Appends the record of one episode. Fields missing from EPISODE_DTYPE are rejected."""
+        record = self.record[0]
+        for name, value in fields.items():
+            record[name] = value
+        record['return_avg'] = self.return_average.add(fields['episode_return'])
+        self.file.write(self.record.tobytes())
+        self.file.flush()
+        if self.returns_file is not None:
+            self.returns_file.write("{}\t{}\n".format(fields['step'], fields['episode_return']))
+            self.returns_file.flush()
+
+    def truncate(self, step: int) -> None:
+        """Drops the episodes logged after step, which a run resumed from a
+        checkpoint at step logs again, and seeds the return average with the
+        episodes kept."""
+        self.file.flush()
+        records = read_metrics(self.path)
+        kept = int(np.searchsorted(records['step'], step, side='right'))
+        self.file.truncate(kept * EPISODE_DTYPE.itemsize)
+        window = self.return_average.values.maxlen
+        for value in records['episode_return'][max(kept - window, 0):kept]:
+            self.return_average.add(float(value))
+
+        if self.returns_file is not None:
+            self.returns_file.close()
+            with open(self.returns_path) as f:
+                lines = [line for line in f if line.strip() and int(line.split('\t')[0]) <= step]
+            self.returns_file = open(self.returns_path, 'w')
+            self.returns_file.writelines(lines)
+            self.returns_file.flush()
+
+    def start_plotting(self) -> bool:
+        """Starts rendering the graphs in a background process, unless the
+        previous rendering is still running. Returns whether it started."""
+        if self.plot_process is not None and self.plot_process.poll() is None:
+            return False
+        self.plot_process = subprocess.Popen([sys.executable, PLOT_SCRIPT, self.path, "--suffix", self.suffix])
+        return True
+
+    def close(self) -> None:
+        self.file.close()
+        if self.returns_file is not None:
+            self.returns_file.close()
+
+
+def read_metrics(path: str) -> np.ndarray:
+    """Returns the episode records of a metrics file as a structured array."""
+    return np.fromfile(path, dtype=EPISODE_DTYPE)
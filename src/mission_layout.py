@@ -0,0 +1,157 @@
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+# Block names for the ids used in FlatWorldGenerator generator strings.
+GENERATOR_BLOCK_IDS = {
+    0: "air",
+    1: "stone",
+    2: "grass",
+    3: "dirt",
+    4: "cobblestone",
+    7: "bedrock",
+    9: "water",
+    12: "sand",
+}
+
+
+class MissionLayout:
+    """The parts of a Malmo mission XML that describe the world and the agent,
+    in plain Python values.
+
+    Only the elements SteveTheBuilder.get_mission_xml writes are read, so this
+    is not a general Malmo schema parser."""
+
+    def __init__(self):
+        # Blocks from the bottom up laid by FlatWorldGenerator, air above them.
+        self.generator_layers: List[str] = []
+        # FileWorldGenerator world the mission starts from, if any.
+        self.world_file: Optional[str] = None
+        # DrawingDecorator cuboids in document order, as
+        # (x1, y1, z1, x2, y2, z2, block type), DrawBlock being a 1x1x1 cuboid.
+        self.draws: List[Tuple[int, int, int, int, int, int, str]] = []
+        # DrawEntity elements as (entity type, x, y, z).
+        self.entities: List[Tuple[str, float, float, float]] = []
+
+        self.agent_name = ""
+        self.agent_position = (0.0, 0.0, 0.0)
+        self.agent_yaw = 0.0
+        self.agent_pitch = 0.0
+        # Inventory slot index -> (item type, quantity).
+        self.inventory: Dict[int, Tuple[str, int]] = {}
+
+        self.discrete_moves = False
+        self.chat_commands = False
+        self.full_stats = False
+        self.full_inventory = False
+        self.hotbar = False
+        self.ray = False
+        # ObservationFromGrid as (name, (min x, y, z), (max x, y, z)).
+        self.grid: Optional[Tuple[str, Tuple[int, int, int], Tuple[int, int, int]]] = None
+        # ObservationFromNearbyEntities as (name, (x range, y range, z range)).
+        self.entity_range: Optional[Tuple[str, Tuple[float, float, float]]] = None
+        self.command_quota: Optional[int] = None
+        # ModSettings MsPerTick, None for Minecraft's default of 50.
+        self.ms_per_tick: Optional[int] = None
+        # RewardForTimeTaken as (initial reward, delta per tick).
+        self.time_reward: Optional[Tuple[float, float]] = None
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _xyz(element) -> Tuple[float, float, float]:
+    return tuple(float(element.get(axis)) for axis in "xyz")
+
+
+def parse_generator_string(generator_string: str) -> List[str]:
+    """Returns block names from the bottom up for a FlatWorldGenerator string
+    such as "3;7,2;1;" (version; layers; biome; features)."""
+    layers = []
+    parts = generator_string.split(';')
+    if len(parts) < 2 or not parts[1]:
+        return layers
+    for layer in parts[1].split(','):
+        count = 1
+        if '*' in layer:
+            count, layer = layer.split('*')
+            count = int(count)
+        block_id = int(layer.split(':')[0])
+        layers.extend([GENERATOR_BLOCK_IDS.get(block_id, "stone")] * count)
+    return layers
+
+
+def parse_mission_xml(mission_xml: str) -> MissionLayout:
+    """Returns the MissionLayout of a mission XML string."""
+    layout = MissionLayout()
+    root = ET.fromstring(mission_xml.strip())
+
+    for element in root.iter():
+        tag = _local_name(element.tag)
+
+        if tag == "FlatWorldGenerator":
+            layout.generator_layers = parse_generator_string(element.get("generatorString", ""))
+        elif tag == "FileWorldGenerator":
+            layout.world_file = element.get("src")
+        elif tag == "DrawCuboid":
+            x1, y1, z1 = (int(element.get(a + "1")) for a in "xyz")
+            x2, y2, z2 = (int(element.get(a + "2")) for a in "xyz")
+            layout.draws.append((min(x1, x2), min(y1, y2), min(z1, z2),
+                                 max(x1, x2), max(y1, y2), max(z1, z2), element.get("type")))
+        elif tag == "DrawBlock":
+            x, y, z = (int(element.get(a)) for a in "xyz")
+            layout.draws.append((x, y, z, x, y, z, element.get("type")))
+        elif tag == "DrawEntity":
+            layout.entities.append((element.get("type"), *_xyz(element)))
+        elif tag == "Name":
+            layout.agent_name = element.text.strip()
+        elif tag == "Placement":
+            layout.agent_position = _xyz(element)
+            layout.agent_yaw = float(element.get("yaw", 0))
+            layout.agent_pitch = float(element.get("pitch", 0))
+        elif tag == "InventoryItem":
+            layout.inventory[int(element.get("slot"))] = (element.get("type"), int(element.get("quantity", 1)))
+        elif tag == "DiscreteMovementCommands":
+            layout.discrete_moves = True
+        elif tag == "ChatCommands":
+            layout.chat_commands = True
+        elif tag == "ObservationFromFullStats":
+            layout.full_stats = True
+        elif tag == "ObservationFromFullInventory":
+            layout.full_inventory = True
+        elif tag == "ObservationFromHotBar":
+            layout.hotbar = True
+        elif tag == "ObservationFromRay":
+            layout.ray = True
+        elif tag == "Grid":
+            bounds = {_local_name(child.tag): tuple(int(v) for v in _xyz(child)) for child in element}
+            layout.grid = (element.get("name"), bounds["min"], bounds["max"])
+        elif tag == "Range":
+            ranges = tuple(float(element.get(a + "range")) for a in "xyz")
+            layout.entity_range = (element.get("name"), ranges)
+        elif tag == "AgentQuitFromReachingCommandQuota":
+            layout.command_quota = int(element.get("total"))
+        elif tag == "MsPerTick":
+            layout.ms_per_tick = int(element.text)
+        elif tag == "RewardForTimeTaken":
+            layout.time_reward = (float(element.get("initialReward")), float(element.get("delta")))
+
+    return layout
+
+
+def fill_commands(layout: MissionLayout, low, high) -> List[str]:
+    """Returns the chat commands that redraw the mission's terrain between two
+    corners: the FlatWorldGenerator layers with air above them, then every
+    DrawingDecorator cuboid clipped to the box."""
+    x1, y1, z1 = low
+    x2, y2, z2 = high
+    commands = [f"chat /fill {x1} {y1} {z1} {x2} {y2} {z2} air"]
+    for y, block in enumerate(layout.generator_layers):
+        if y1 <= y <= y2:
+            commands.append(f"chat /fill {x1} {y} {z1} {x2} {y} {z2} {block}")
+    for dx1, dy1, dz1, dx2, dy2, dz2, block in layout.draws:
+        lo = (max(dx1, x1), max(dy1, y1), max(dz1, z1))
+        hi = (min(dx2, x2), min(dy2, y2), min(dz2, z2))
+        if all(l <= h for l, h in zip(lo, hi)):
+            commands.append(f"chat /fill {lo[0]} {lo[1]} {lo[2]} {hi[0]} {hi[1]} {hi[2]} {block}")
+    return commands
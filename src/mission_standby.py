@@ -0,0 +1,57 @@
+import threading
+
+
+class MissionStandby:
+    """A second Minecraft client that starts the next episode's mission in the
+    background while the current episode is still running, so reset() only
+    has to swap agent hosts instead of waiting for the mission to start.
+
+    The standby mission starts ticking as soon as it begins (the Ghast
+    included), so it should only be started close to the end of an episode."""
+
+    def __init__(self, agent_host, client, start_mission):
+        self.agent_host = agent_host
+        self.client = client
+        # Callable (agent_host, client, mission_xml) -> world state of the
+        # mission once it began.
+        self.start_mission = start_mission
+
+        self.thread = None
+        self.mission_xml = None
+        self.world_state = None
+
+    @property
+    def started(self) -> bool:
+        return self.thread is not None
+
+    def start(self, mission_xml: str) -> None:
+        """Starts the mission on the standby client in a background thread."""
+        self.mission_xml = mission_xml
+        self.world_state = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        try:
+            self.world_state = self.start_mission(self.agent_host, self.client, self.mission_xml)
+        except Exception as e:
+            # start_mission raises ClientError on failure, which leaves no
+            # world state, and init_malmo then starts the mission instead.
+            print("Error starting standby mission:", e)
+
+    def take(self):
+        """
+        Waits for the standby mission to begin.
+
+        Returns
+            mission_xml: <str> the mission that was started
+            world_state: <object> its first world state, None if it failed to start
+        """
+        self.thread.join()
+        self.thread = None
+        return self.mission_xml, self.world_state
+
+    def swap(self, agent_host, client) -> None:
+        """Makes the previously active agent host and client the standby ones."""
+        self.agent_host = agent_host
+        self.client = client
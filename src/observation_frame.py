@@ -0,0 +1,87 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+import step_profiler
+
+
+class ObservationFrame:
+    """A single Malmo observation, decoded once and shared by every reward and
+    observation function for the step it was taken on.
+
+    Malmo sends each observation as a JSON string. Decoding it in every reward
+    term made the per-step cost grow with the number of terms, and let terms
+    read different world states, so all consumers go through this instead."""
+
+    def __init__(self, observations: dict, payload_size: int = 0, text: Optional[str] = None):
+        self.observations = observations
+        # Length of the JSON text the observations were decoded from.
+        self.payload_size = payload_size
+        # The JSON text itself, if the frame was decoded from a world state.
+        self.text = text
+        # Entities indexed by name, built lazily since not every step needs it.
+        self._entities: Optional[Dict[str, List[dict]]] = None
+
+    @classmethod
+    def from_world_state(cls, world_state) -> Optional['ObservationFrame']:
+        """Returns a frame for the latest observation in the world state.
+        Returns None if the mission is not running or there are no new observations."""
+        if world_state.is_mission_running and \
+        world_state.number_of_observations_since_last_state > 0:
+            text = world_state.observations[-1].text
+            with step_profiler.profiler.section("json_decode"):
+                observations = json.loads(text)
+            return cls(observations, len(text), text)
+        return None
+
+    @property
+    def life(self) -> float:
+        return self.observations['Life']
+
+    @property
+    def inventory_slot_0_size(self) -> int:
+        """From ObservationFromFullInventory, or ObservationFromHotBar without it."""
+        if 'InventorySlot_0_size' in self.observations:
+            return self.observations['InventorySlot_0_size']
+        return self.observations['Hotbar_0_size']
+
+    @property
+    def damage_taken(self) -> int:
+        return self.observations['DamageTaken']
+
+    @property
+    def position(self) -> Tuple[float, float, float]:
+        """(x, y, z) of the agent's feet."""
+        observations = self.observations
+        return observations['XPos'], observations['YPos'], observations['ZPos']
+
+    @property
+    def yaw(self) -> float:
+        return self.observations['Yaw']
+
+    @property
+    def pitch(self) -> float:
+        return self.observations['Pitch']
+
+    @property
+    def total_time(self) -> Optional[int]:
+        """Ticks since the mission began, None if ObservationFromFullStats is off."""
+        return self.observations.get('TotalTime')
+
+    @property
+    def nearby_volume(self) -> Optional[List[str]]:
+        """Block names of the "nearbyVolume" grid, None if it was not sent."""
+        return self.observations.get('nearbyVolume')
+
+    @property
+    def entities(self) -> Dict[str, List[dict]]:
+        """entitySight entries grouped by entity name, in observation order."""
+        if self._entities is None:
+            self._entities = {}
+            for entity in self.observations.get('entitySight', ()):
+                self._entities.setdefault(entity['name'], []).append(entity)
+        return self._entities
+
+    def entity(self, name: str) -> Optional[dict]:
+        """Returns the first entity with the given name, None if not in sight."""
+        found = self.entities.get(name)
+        return found[0] if found else None
@@ -0,0 +1,48 @@
+"""Renders the SteveTheBuilder training graphs from a metrics file.
+
+    python plot_metrics.py metrics.bin [--suffix -3] [--out-dir .]
+
+SteveTheBuilder runs this in a background process every log_frequency
+episodes, so matplotlib never runs on the environment's step loop."""
+
+import argparse
+import os
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from metrics_log import read_metrics
+
+# (field, y label, file name) of every graph against the training step.
+GRAPHS = [
+    ('blocks_placed', 'Number Of Blocks Placed', 'blocks'),
+    ('damage_taken', 'Damage Taken', 'damage'),
+    ('face_ghast_count', 'Number Of Blocks Placed', 'faceGhast'),
+    ('correct_position_block', 'Correct position of block', 'correctPosition'),
+    ('shelter_coverage', 'Ghast Line Of Sight Covered', 'shelterCoverage'),
+    ('return_avg', 'Return', 'returns'),
+]
+
+
+def plot_metrics(path: str, suffix: str = "", out_dir: str = ".") -> None:
+    records = read_metrics(path)
+    for field, label, name in GRAPHS:
+        # The first episode's damage includes whatever the client took before
+        # training started, so it is left out.
+        shown = records[1:] if field == 'damage_taken' else records
+        plt.clf()
+        plt.plot(shown['step'], shown[field])
+        plt.title('SteveTheBuilder')
+        plt.ylabel(label)
+        plt.xlabel('Steps')
+        plt.savefig(os.path.join(out_dir, f'{name}{suffix}.png'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render SteveTheBuilder training graphs.")
+    parser.add_argument('path', help="metrics file written by SteveTheBuilder")
+    parser.add_argument('--suffix', default="", help="appended to the graph file names")
+    parser.add_argument('--out-dir', default=".", help="directory to write the graphs to")
+    args = parser.parse_args()
+    plot_metrics(args.path, args.suffix, args.out_dir)
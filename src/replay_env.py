@@ -0,0 +1,93 @@
+import gym
+import numpy as np
+
+import main
+from episode_recorder import REJECTED, EpisodeRecording
+from sim_malmo import TimestampedReward
+
+
+class ReplayEnv(gym.Env):
+    """Serves the episodes of a recording back through the SteveTheBuilder
+    interface, without a Minecraft client.
+
+    Observations and rewards are recomputed from the recorded observation
+    JSON and Malmo rewards by a template SteveTheBuilder, so changes to the
+    observation encoding or the reward terms apply to replayed play. The
+    actions passed to step() are ignored, since the recorded observations
+    follow the recorded actions; those are returned in the info dict as
+    "recorded_action". Episodes are served in order, wrapping around."""
+
+    def __init__(self, env_config):
+        self.template = main.SteveTheBuilder(dict(env_config, backend="sim", metrics_file=None, record_file=None))
+        self.observation_space = self.template.observation_space
+        self.action_space = self.template.action_space
+        self.recording = EpisodeRecording(env_config.get('replay_file', main.replay_file))
+        # Episodes with at least one step.
+        self.episodes = [i for i in range(len(self.recording)) if len(self.recording.episode(i)) > 1]
+        assert self.episodes, f"No steps recorded in {self.recording.path}."
+
+        self.episode_index = -1
+        self.records = None
+        self.position = 0
+
+    def reset(self):
+        self.episode_index = (self.episode_index + 1) % len(self.episodes)
+        self.records = self.recording.episode(self.episodes[self.episode_index])
+        self.position = 0
+
+        template = self.template
+        template.append_episode_stats()
+        template.reset_episode_variables()
+        template.frame = self.recording.frame(self.records[0])
+        if template.track_shelter:
+            template.shelter.observe(template.frame)
+        # DamageTaken is cumulative, so the damage reward counts from the
+        # previous recorded episode's last observation, as it did live.
+        last_frame = self.last_frame(self.episodes[self.episode_index] - 1)
+        if last_frame is None:
+            last_frame = template.frame
+        if last_frame is not None:
+            template.last_damage_taken = last_frame.damage_taken
+        return template.observation(template.encode_observation(template.frame))
+
+    def last_frame(self, index):
+        """Returns the last observation recorded in an episode, None if there
+        is none or no such episode."""
+        if index < 0:
+            return None
+        for record in self.recording.episode(index)[::-1]:
+            if record['obs_length'] > 0:
+                return self.recording.frame(record)
+        return None
+
+    def step(self, action):
+        self.position += 1
+        record = self.records[self.position]
+        template = self.template
+        action = int(record['action'][0]) if template.discrete_moves else np.array(record['action'])
+        if template.discrete_moves:
+            template.accept_action(template.action_dict[action])
+        template.frame = self.recording.frame(record)
+
+        obs = template.encode_observation(template.frame)
+        if record['kind'] == REJECTED:
+            # The action was dropped, nothing happened in the world.
+            reward = 0
+        else:
+            template.episode_step += 1
+            reward = template.step_reward([TimestampedReward(float(record['malmo_reward']))], template.frame)
+        # Recordings cut off mid-episode end where they stop.
+        done = bool(record['done']) or self.position == len(self.records) - 1
+        info = {'recorded_action': action, 'recorded_reward': float(record['reward'])}
+        return template.observation(obs), reward, done, info
+
+    def transitions(self):
+        """Yields (observation, recorded action, reward, next observation, done)
+        for every recorded step, e.g. to seed an off-policy learner's replay buffer."""
+        for _ in range(len(self.episodes)):
+            obs = self.reset()
+            done = False
+            while not done:
+                next_obs, reward, done, info = self.step(None)
+                yield obs, info['recorded_action'], reward, next_obs, done
+                obs = next_obs
@@ -0,0 +1,196 @@
+"""Sparse index of the blocks the agent placed, for shelter queries.
+
+The observations never say which blocks the agent placed, and the hill
+terrain is built of the same cobblestone it places. ShelterIndex keeps the
+set of cells holding placed blocks up to date from what changes between
+observations: a drop of the inventory count says how many blocks were placed,
+and the cells of the "nearbyVolume" grid that turned into the player's block
+(or the block in the line of sight, when the grid missed it) say where.
+Cells that stop holding the block are dropped again.
+
+Updates cost one comparison of the grid with the previous one, plus a set
+operation per changed cell. Queries look up cells in the set: a fixed
+neighbourhood for the enclosure, and the cells a line of sight crosses for
+coverage, so neither grows with the arena, obs_size or the blocks placed."""
+
+import math
+from typing import Iterator, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from entity_tracker import EntityTracker
+from observation_frame import ObservationFrame
+
+Cell = Tuple[int, int, int]
+
+EYE_HEIGHT = 1.62
+# Height above an entity's position its lines of sight start from.
+ENTITY_CENTER_HEIGHTS = {"Ghast": 2.0}
+DEFAULT_CENTER_HEIGHT = 0.5
+
+# Cells around the agent's feet that enclose it: the four sides of its feet
+# and of its head, and the cell above its head.
+ENCLOSURE_OFFSETS = ((1, 0, 0), (-1, 0, 0), (0, 0, 1), (0, 0, -1),
+                     (1, 1, 0), (-1, 1, 0), (0, 1, 1), (0, 1, -1),
+                     (0, 2, 0))
+
+
+def line_cells(start: Sequence[float], end: Sequence[float]) -> Iterator[Cell]:
+    """Yields the cells a segment passes through, from start's to end's, by
+    stepping from one cell boundary to the next (Amanatides and Woo)."""
+    cell = [math.floor(c) for c in start]
+    last = [math.floor(c) for c in end]
+    step, t_max, t_delta = [], [], []
+    for axis in range(3):
+        d = end[axis] - start[axis]
+        step.append(1 if d > 0 else -1)
+        if d == 0:
+            t_max.append(math.inf)
+            t_delta.append(math.inf)
+        else:
+            # Fraction of the segment at which it crosses the next boundary
+            # of this axis, and between two boundaries.
+            boundary = cell[axis] + (1 if d > 0 else 0)
+            t_max.append((boundary - start[axis]) / d)
+            t_delta.append(abs(1 / d))
+    x, y, z = cell
+    step_x, step_y, step_z = step
+    t_x, t_y, t_z = t_max
+    delta_x, delta_y, delta_z = t_delta
+    yield x, y, z
+    for _ in range(abs(last[0] - x) + abs(last[1] - y) + abs(last[2] - z)):
+        if t_x <= t_y and t_x <= t_z:
+            x += step_x
+            t_x += delta_x
+        elif t_y <= t_z:
+            y += step_y
+            t_y += delta_y
+        else:
+            z += step_z
+            t_z += delta_z
+        yield x, y, z
+
+
+class ShelterIndex:
+    """The cells holding blocks the agent placed during the current episode.
+
+    Call observe() with every frame of the episode, starting with the one
+    reset() returned. Placements that showed up in the inventory but neither
+    in the grid nor in the line of sight are counted in self.unlocated."""
+
+    def __init__(self, block: str, grid_low: Cell, grid_shape: Tuple[int, int, int]):
+        """
+        Args
+            block: <str> the block the agent places
+            grid_low: <tuple> (x, y, z) of the "nearbyVolume" grid's lowest
+                corner, relative to the agent's feet
+            grid_shape: <tuple> the grid's (y, z, x) shape, as Malmo lists it
+        """
+        self.block = block
+        ny, nz, nx = grid_shape
+        y, z, x = np.unravel_index(np.arange(ny * nz * nx), grid_shape)
+        # Offset from the agent's feet of every grid entry.
+        self.grid_offsets = list(zip((x + grid_low[0]).tolist(), (y + grid_low[1]).tolist(),
+                                     (z + grid_low[2]).tolist()))
+        self.clear()
+
+    def clear(self) -> None:
+        """Forgets every placed block, e.g. at the start of an episode."""
+        self.placed: Set[Cell] = set()
+        self.unlocated = 0
+        self.feet: Optional[Cell] = None
+        self.grid = None
+        self.inventory = None
+
+    def __len__(self) -> int:
+        return len(self.placed)
+
+    def observe(self, frame: Optional[ObservationFrame]) -> None:
+        """Updates the placed blocks from the changes since the previous frame."""
+        if frame is None:
+            return
+        x, y, z = frame.position
+        feet = (math.floor(x), math.floor(y), math.floor(z))
+        inventory = frame.inventory_slot_0_size
+        placed = max(self.inventory - inventory, 0) if self.inventory is not None else 0
+        self.inventory = inventory
+        located = 0
+
+        grid = frame.nearby_volume
+        if grid is not None and grid != self.grid:
+            fx, fy, fz = feet
+            if feet == self.feet and self.grid is not None:
+                # Same window: blocks that appeared were placed, as far as
+                # the inventory says so.
+                for i, (name, previous) in enumerate(zip(grid, self.grid)):
+                    if name != previous:
+                        dx, dy, dz = self.grid_offsets[i]
+                        cell = (fx + dx, fy + dy, fz + dz)
+                        if name != self.block:
+                            self.placed.discard(cell)
+                        elif located < placed:
+                            self.placed.add(cell)
+                            located += 1
+            elif self.placed:
+                # A new window: blocks first seen now are terrain, only
+                # placed blocks that are gone are dropped.
+                for (dx, dy, dz), name in zip(self.grid_offsets, grid):
+                    if name != self.block:
+                        self.placed.discard((fx + dx, fy + dy, fz + dz))
+        self.feet = feet
+        self.grid = grid
+
+        # A block placed outside the grid is the one the agent now looks at.
+        sight = frame.observations.get('LineOfSight')
+        if located < placed and sight is not None and sight.get('type') == self.block:
+            cell = self.sight_cell(sight, frame)
+            if cell not in self.placed:
+                self.placed.add(cell)
+                located += 1
+        self.unlocated += placed - located
+
+    @staticmethod
+    def sight_cell(sight: dict, frame: ObservationFrame) -> Cell:
+        """Returns the cell of the block in the line of sight. Malmo reports
+        the point the line of sight hits, which lies on the block's face, so
+        the point is moved a little further along the line; the simulator
+        reports the cell itself, as integers."""
+        x, y, z = sight['x'], sight['y'], sight['z']
+        if isinstance(x, int) and isinstance(y, int) and isinstance(z, int):
+            return x, y, z
+        yaw, pitch = math.radians(frame.yaw), math.radians(frame.pitch)
+        nudge = 1e-3
+        x += -math.sin(yaw) * math.cos(pitch) * nudge
+        y += -math.sin(pitch) * nudge
+        z += math.cos(yaw) * math.cos(pitch) * nudge
+        return math.floor(x), math.floor(y), math.floor(z)
+
+    def enclosure(self, feet: Sequence[float]) -> float:
+        """Returns the fraction of the cells around an agent standing at feet
+        (see ENCLOSURE_OFFSETS) that hold placed blocks."""
+        if not self.placed:
+            return 0.0
+        fx, fy, fz = (math.floor(c) for c in feet)
+        return sum((fx + dx, fy + dy, fz + dz) in self.placed for dx, dy, dz in ENCLOSURE_OFFSETS) / len(ENCLOSURE_OFFSETS)
+
+    def covers(self, start: Sequence[float], end: Sequence[float]) -> bool:
+        """Whether a placed block lies on the segment from start to end."""
+        if not self.placed:
+            return False
+        placed = self.placed
+        return any(cell in placed for cell in line_cells(start, end))
+
+    def coverage(self, entities: EntityTracker, name: str) -> np.ndarray:
+        """Returns, for every entity of a type the tracker observed, whether a
+        placed block lies on its line of sight to the agent's eyes. All False
+        if the agent is not in sight."""
+        indices = entities.of_type(name)
+        covered = np.zeros(len(indices), dtype=bool)
+        if entities.agent is None or not self.placed:
+            return covered
+        x, y, z = entities.positions[entities.agent].tolist()
+        eye = (x, y + EYE_HEIGHT, z)
+        height = ENTITY_CENTER_HEIGHTS.get(name, DEFAULT_CENTER_HEIGHT)
+        for i, (x, y, z) in enumerate(entities.positions[indices].tolist()):
+            covered[i] = self.covers(eye, (x, y + height, z))
+        return covered
@@ -0,0 +1,585 @@
+"""In-process stand-in for MalmoPython, backed by a NumPy voxel world.
+
+Exposes the part of the MalmoPython surface SteveTheBuilder uses (AgentHost,
+WorldState, MissionSpec, MissionRecordSpec, ClientPool and ClientInfo), so the
+environment can run without a Minecraft client. The world is built from the
+same mission XML a real client would receive.
+
+The world only advances when it is polled: every AgentHost.getWorldState call
+while a mission is running simulates one game tick and produces one
+observation. Simulated time is therefore decoupled from wall time, and the
+fixed sleeps of "legacy" step synchronization only slow it down."""
+
+import datetime
+import json
+import math
+import uuid
+from typing import List, Optional
+
+import numpy as np
+
+from mission_layout import MissionLayout, parse_mission_xml
+
+# Block ids of the voxel world. Unknown block names get appended on first use.
+BLOCK_NAMES = ["air", "stone", "grass", "dirt", "cobblestone", "bedrock", "water", "sand"]
+BLOCK_IDS = {name: i for i, name in enumerate(BLOCK_NAMES)}
+AIR = BLOCK_IDS["air"]
+WATER = BLOCK_IDS["water"]
+
+# Game constants, in blocks and ticks (20 ticks per second).
+MAX_LIFE = 20.0
+EYE_HEIGHT = 1.62
+BODY_CENTER_HEIGHT = 0.9
+# ContinuousMovementCommands turn and pitch at 180 degrees per second at full speed.
+TURN_DEGREES_PER_TICK = 9.0
+# A held "use" places a block every 4 ticks, as right-clicking does in game.
+USE_COOLDOWN_TICKS = 4
+REACH = 4.5
+# ObservationFromRay looks further than the agent can reach.
+RAY_LENGTH = 20.0
+RAY_STEP = 0.1
+RAY_SAMPLES = np.arange(0, RAY_LENGTH, RAY_STEP)
+GHAST_FIRE_INTERVAL = 60
+GHAST_FIRST_SHOT_TICKS = 20
+GHAST_HEIGHT = 4.0
+FIREBALL_SPEED = 1.0
+FIREBALL_MAX_TICKS = 200
+FIREBALL_HIT_RADIUS = 0.9
+EXPLOSION_RADIUS = 2.0
+FIREBALL_NAME = "Fireball"
+INVENTORY_KEYS = [(f'InventorySlot_{slot}_size', f'InventorySlot_{slot}_item') for slot in range(41)]
+HOTBAR_KEYS = [(f'Hotbar_{slot}_size', f'Hotbar_{slot}_item') for slot in range(9)]
+
+
+def block_id(name: str) -> int:
+    """Returns the voxel id of a block name, registering unknown names."""
+    if name not in BLOCK_IDS:
+        BLOCK_IDS[name] = len(BLOCK_NAMES)
+        BLOCK_NAMES.append(name)
+    return BLOCK_IDS[name]
+
+
+def is_passable(ids: np.ndarray) -> np.ndarray:
+    """Blocks that neither stop the agent's line of sight nor fireballs."""
+    return (ids == AIR) | (ids == WATER)
+
+
+def wrap_degrees(angle: float) -> float:
+    """Wraps an angle into [-180, 180)."""
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def look_direction(yaw: float, pitch: float) -> np.ndarray:
+    """Unit vector of a Minecraft yaw/pitch: yaw 0 faces +z (south), yaw 90
+    faces -x (west), positive pitch looks down."""
+    yaw_rad = math.radians(yaw)
+    pitch_rad = math.radians(pitch)
+    horizontal = math.cos(pitch_rad)
+    return np.array([-math.sin(yaw_rad) * horizontal, -math.sin(pitch_rad), math.cos(yaw_rad) * horizontal])
+
+
+class ClientInfo:
+    def __init__(self, ip_address: str = '127.0.0.1', control_port: int = 10000, command_port: int = 0):
+        self.ip_address = ip_address
+        self.control_port = control_port
+        self.command_port = command_port
+
+    def __repr__(self):
+        return f"ClientInfo({self.ip_address}:{self.control_port})"
+
+
+class ClientPool:
+    def __init__(self):
+        self.clients: List[ClientInfo] = []
+
+    def add(self, client_info: ClientInfo) -> None:
+        self.clients.append(client_info)
+
+
+class MissionSpec:
+    def __init__(self, xml: str = "", validate: bool = True):
+        self.xml = xml
+        self.layout = parse_mission_xml(xml)
+        self.video = None
+        self.viewpoint = 0
+
+    def requestVideo(self, width: int, height: int) -> None:
+        self.video = (width, height)
+
+    def setViewpoint(self, viewpoint: int) -> None:
+        self.viewpoint = viewpoint
+
+    def forceWorldReset(self) -> None:
+        pass
+
+    def getAsXML(self, pretty_print: bool = False) -> str:
+        return self.xml
+
+
+class MissionRecordSpec:
+    def __init__(self, destination: str = ""):
+        self.destination = destination
+
+
+class TimestampedString:
+    def __init__(self, text: str):
+        self.timestamp = datetime.datetime.now()
+        self.text = text
+
+
+class TimestampedReward:
+    def __init__(self, value: float):
+        self.timestamp = datetime.datetime.now()
+        self.value = value
+
+    def getValue(self) -> float:
+        return self.value
+
+
+class WorldState:
+    def __init__(self, has_mission_begun=False, is_mission_running=False, observations=(), rewards=()):
+        self.has_mission_begun = has_mission_begun
+        self.is_mission_running = is_mission_running
+        self.observations = list(observations)
+        self.rewards = list(rewards)
+        self.video_frames = []
+        self.errors = []
+        self.mission_control_messages = []
+        self.number_of_observations_since_last_state = len(self.observations)
+        self.number_of_rewards_since_last_state = len(self.rewards)
+        self.number_of_video_frames_since_last_state = 0
+
+
+def rasterize(layout: MissionLayout, low, high) -> np.ndarray:
+    """Returns the block ids of the mission's terrain between two corners,
+    indexed [x, y, z] from the low corner. Only the part of every cuboid
+    inside the box is drawn, so small boxes are cheap to build."""
+    low = np.array(low)
+    shape = np.array(high) - low + 1
+    blocks = np.zeros(shape, dtype=np.uint8)
+    for y, name in enumerate(layout.generator_layers):
+        if 0 <= y - low[1] < shape[1]:
+            blocks[:, y - low[1], :] = block_id(name)
+    for x1, y1, z1, x2, y2, z2, name in layout.draws:
+        lo = np.maximum(np.array((x1, y1, z1)) - low, 0)
+        hi = np.minimum(np.array((x2, y2, z2)) - low + 1, shape)
+        if np.all(hi > lo):
+            blocks[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] = block_id(name)
+    return blocks
+
+
+# Rasterized terrain by (generator layers, draws, low corner, high corner).
+# Every mission of a problem type draws the same terrain, so it is built once
+# per process and copied for each mission.
+TERRAIN_CACHE_SIZE = 16
+terrain_cache = {}
+
+
+def cached_terrain(layout: MissionLayout, low, high) -> np.ndarray:
+    """Returns a writable copy of rasterize(layout, low, high), built once per terrain."""
+    key = (tuple(layout.generator_layers), tuple(layout.draws), tuple(int(v) for v in low), tuple(int(v) for v in high))
+    blocks = terrain_cache.get(key)
+    if blocks is None:
+        if len(terrain_cache) >= TERRAIN_CACHE_SIZE:
+            terrain_cache.clear()
+        blocks = terrain_cache[key] = rasterize(layout, low, high)
+    return blocks.copy()
+
+
+class SimWorld:
+    """Voxel grid of block ids covering everything the mission draws. Outside
+    the grid the FlatWorldGenerator layers are assumed, with air above them."""
+
+    def __init__(self, layout: MissionLayout, margin: int = 8):
+        self.layers = np.array([block_id(name) for name in layout.generator_layers], dtype=np.uint8)
+
+        points = [(x, y, z) for x1, y1, z1, x2, y2, z2, _ in layout.draws for x, y, z in ((x1, y1, z1), (x2, y2, z2))]
+        points.append(tuple(int(math.floor(v)) for v in layout.agent_position))
+        points.extend((int(x), int(y), int(z)) for _, x, y, z in layout.entities)
+        points = np.array(points)
+        low = points.min(axis=0) - margin
+        high = points.max(axis=0) + margin
+        low[1] = min(low[1], 0)
+        high[1] = max(high[1], len(self.layers))
+
+        self.origin = low
+        self.shape = high - low + 1
+        self.blocks = cached_terrain(layout, low, high)
+
+    def fill(self, low, high, name: str) -> None:
+        """Sets every block of the cuboid between two corners, clipped to the grid."""
+        lo = np.maximum(np.array(low) - self.origin, 0)
+        hi = np.minimum(np.array(high) - self.origin + 1, self.shape)
+        if np.all(hi > lo):
+            self.blocks[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] = block_id(name)
+
+    def blocks_at(self, cells: np.ndarray) -> np.ndarray:
+        """Returns the block ids of an (N, 3) integer array of cells."""
+        local = cells - self.origin
+        inside = ((local >= 0) & (local < self.shape)).all(axis=1)
+        if inside.all():
+            return self.blocks[local[:, 0], local[:, 1], local[:, 2]]
+
+        ids = np.zeros(len(cells), dtype=np.uint8)
+        ys = cells[:, 1]
+        in_layers = (ys >= 0) & (ys < len(self.layers))
+        ids[in_layers] = self.layers[ys[in_layers]]
+        local = local[inside]
+        ids[inside] = self.blocks[local[:, 0], local[:, 1], local[:, 2]]
+        return ids
+
+    def region(self, low, high) -> np.ndarray:
+        """Returns the block ids between two corners, indexed [x, y, z]."""
+        lo = np.array(low) - self.origin
+        hi = np.array(high) - self.origin + 1
+        if np.all(lo >= 0) and np.all(hi <= self.shape):
+            return self.blocks[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        xs, ys, zs = np.meshgrid(*(np.arange(l, h + 1) for l, h in zip(low, high)), indexing='ij')
+        cells = np.stack([xs.ravel(), ys.ravel(), zs.ravel()], axis=1)
+        return self.blocks_at(cells).reshape(xs.shape)
+
+    def line_is_clear(self, start: np.ndarray, end: np.ndarray) -> bool:
+        """Whether no solid block lies on the segment between two points."""
+        length = float(np.linalg.norm(end - start))
+        samples = max(int(length / 0.25), 1)
+        points = start + np.linspace(0, 1, samples + 1)[:, None] * (end - start)
+        return bool(is_passable(self.blocks_at(np.floor(points).astype(np.int64))).all())
+
+
+class SimEntity:
+    def __init__(self, name: str, entity_id: str, position, life: Optional[float] = None):
+        self.name = name
+        self.id = entity_id
+        self.position = np.array(position, dtype=np.float64)
+        self.motion = np.zeros(3)
+        self.yaw = 0.0
+        self.pitch = 0.0
+        self.life = life
+        self.cooldown = GHAST_FIRST_SHOT_TICKS
+        self.age = 0
+
+    def sight_entry(self) -> dict:
+        entry = {
+            'yaw': wrap_degrees(self.yaw), 'x': self.position[0], 'y': self.position[1],
+            'z': self.position[2], 'pitch': self.pitch, 'id': self.id,
+            'motionX': self.motion[0], 'motionY': self.motion[1], 'motionZ': self.motion[2],
+            'name': self.name,
+        }
+        if self.life is not None:
+            entry['life'] = self.life
+        return entry
+
+
+class SimMission:
+    """One running mission: the world, the agent and the mobs."""
+
+    def __init__(self, layout: MissionLayout, rng: np.random.Generator, damage_taken: int = 0):
+        self.layout = layout
+        self.rng = rng
+        self.world = SimWorld(layout)
+        self.running = True
+        self.quit_requested = False
+        self.tick_count = 0
+        self.commands_received = 0
+        self.pending_commands = []
+        self.pending_reward = 0.0
+        self.has_reward = False
+
+        self.agent = SimEntity(layout.agent_name, self.new_id(), layout.agent_position, MAX_LIFE)
+        self.agent.yaw = layout.agent_yaw
+        self.agent.pitch = layout.agent_pitch
+        # Like the game's statistic, DamageTaken carries over between missions.
+        self.damage_taken = damage_taken
+        self.inventory = {slot: [item, quantity] for slot, (item, quantity) in layout.inventory.items()}
+        self.turn_rate = 0.0
+        self.pitch_rate = 0.0
+        self.use_held = False
+        self.use_cooldown = 0
+
+        self.mobs = [SimEntity(name, self.new_id(), (x, y, z), 10.0) for name, x, y, z in layout.entities]
+        self.fireballs: List[SimEntity] = []
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(bytes=self.rng.bytes(16)))
+
+    # Commands
+
+    def command(self, text: str) -> None:
+        self.commands_received += 1
+        if self.layout.command_quota is not None and self.commands_received >= self.layout.command_quota:
+            self.quit_requested = True
+
+        verb, _, argument = text.partition(' ')
+        if verb == "chat":
+            if self.layout.chat_commands:
+                self.chat(argument)
+            return
+        value = float(argument) if argument else 1.0
+        if verb == "turn":
+            if self.layout.discrete_moves:
+                self.agent.yaw += 90 * np.sign(value)
+            else:
+                self.turn_rate = float(np.clip(value, -1, 1))
+        elif verb == "look":
+            self.agent.pitch = float(np.clip(self.agent.pitch + 45 * np.sign(value), -90, 90))
+        elif verb == "pitch":
+            self.pitch_rate = float(np.clip(value, -1, 1))
+        elif verb == "use":
+            if self.layout.discrete_moves:
+                self.place_block()
+            else:
+                self.use_held = value > 0
+        elif verb == "quit":
+            self.quit_requested = True
+
+    def chat(self, message: str) -> None:
+        """Runs the server commands SteveTheBuilder sends through ChatCommands.
+        Selectors are assumed to target the agent (@p) or every mob (@e)."""
+        if not message.startswith('/'):
+            return
+        words = message[1:].split()
+        name, args = words[0], words[1:]
+        if name == "fill":
+            x1, y1, z1, x2, y2, z2 = (int(float(v)) for v in args[:6])
+            self.world.fill((min(x1, x2), min(y1, y2), min(z1, z2)), (max(x1, x2), max(y1, y2), max(z1, z2)), args[6])
+        elif name == "kill" and args and args[0].startswith("@e"):
+            self.mobs = []
+            self.fireballs = []
+        elif name == "summon":
+            entity_name = args[0].split(':')[-1].capitalize()
+            self.mobs.append(SimEntity(entity_name, self.new_id(), [float(v) for v in args[1:4]], 10.0))
+        elif name == "tp":
+            self.agent.position = np.array([float(v) for v in args[1:4]])
+            if len(args) >= 6:
+                self.agent.yaw = float(args[4])
+                self.agent.pitch = float(args[5])
+        elif name == "clear":
+            self.inventory = {}
+        elif name == "replaceitem" and args[2] == "slot.hotbar.0":
+            self.inventory[0] = [args[3], int(args[4]) if len(args) > 4 else 1]
+        elif name == "effect" and args[1].endswith("instant_health"):
+            self.agent.life = MAX_LIFE
+
+    # Simulation
+
+    def eye(self) -> np.ndarray:
+        return self.agent.position + (0, EYE_HEIGHT, 0)
+
+    def body_center(self) -> np.ndarray:
+        return self.agent.position + (0, BODY_CENTER_HEIGHT, 0)
+
+    def raycast(self, length: float):
+        """Returns (cell hit, free cell before it, distance) along the agent's
+        line of sight, or None if nothing solid is within length."""
+        samples = RAY_SAMPLES[:int(length / RAY_STEP)]
+        points = self.eye() + samples[:, None] * look_direction(self.agent.yaw, self.agent.pitch)
+        cells = np.floor(points).astype(np.int64)
+        solid = ~is_passable(self.world.blocks_at(cells))
+        if not solid.any():
+            return None
+        hit = int(np.argmax(solid))
+        before = cells[hit - 1] if hit > 0 else None
+        return cells[hit], before, float(samples[hit])
+
+    def place_block(self) -> None:
+        """Places the block in inventory slot 0 against the block looked at."""
+        item = self.inventory.get(0)
+        if item is None or item[1] <= 0:
+            return
+        target = self.raycast(REACH)
+        if target is None or target[1] is None:
+            return
+        cell = target[1]
+        feet = np.floor(self.agent.position).astype(np.int64)
+        if cell[0] == feet[0] and cell[2] == feet[2] and feet[1] <= cell[1] <= feet[1] + 1:
+            return
+        self.world.fill(cell, cell, item[0])
+        item[1] -= 1
+        if item[1] == 0:
+            del self.inventory[0]
+
+    def update_mob(self, mob: SimEntity) -> None:
+        """Ghasts hover in place, face the agent and shoot a fireball at it
+        every GHAST_FIRE_INTERVAL ticks."""
+        center = mob.position + (0, GHAST_HEIGHT / 2, 0)
+        to_agent = self.body_center() - center
+        distance = float(np.linalg.norm(to_agent))
+        if distance == 0:
+            return
+        mob.yaw = math.degrees(math.atan2(-to_agent[0], to_agent[2]))
+        mob.pitch = -math.degrees(math.asin(to_agent[1] / distance))
+        mob.cooldown -= 1
+        if mob.cooldown > 0:
+            return
+        mob.cooldown = GHAST_FIRE_INTERVAL
+        direction = to_agent / distance
+        fireball = SimEntity(FIREBALL_NAME, self.new_id(), center + direction * (GHAST_HEIGHT / 2))
+        fireball.motion = direction * FIREBALL_SPEED
+        fireball.yaw, fireball.pitch = mob.yaw, mob.pitch
+        self.fireballs.append(fireball)
+
+    def update_fireball(self, fireball: SimEntity) -> bool:
+        """Moves a fireball one tick. Returns whether it is still flying."""
+        fireball.age += 1
+        start = fireball.position
+        end = start + fireball.motion
+        points = start + np.linspace(0, 1, 5)[1:, None] * fireball.motion
+        solid = ~is_passable(self.world.blocks_at(np.floor(points).astype(np.int64)))
+
+        # Closest approach of the segment to the agent's body.
+        center = self.body_center()
+        t = np.clip(np.dot(center - start, fireball.motion) / np.dot(fireball.motion, fireball.motion), 0, 1)
+        hits_agent = np.linalg.norm(start + t * fireball.motion - center) < FIREBALL_HIT_RADIUS
+
+        if solid.any():
+            first = int(np.argmax(solid))
+            self.explode(points[first - 1] if first > 0 else start)
+            return False
+        if hits_agent:
+            self.explode(start + t * fireball.motion)
+            return False
+        fireball.position = end
+        return fireball.age < FIREBALL_MAX_TICKS
+
+    def explode(self, point: np.ndarray) -> None:
+        """Damages the agent with Minecraft's explosion formula. Fireball
+        explosions do not break cobblestone, so blocks are left alone."""
+        center = self.body_center()
+        distance = float(np.linalg.norm(center - point))
+        if distance > EXPLOSION_RADIUS:
+            return
+        exposure = 1.0 if self.world.line_is_clear(point, center) else 0.0
+        impact = (1 - distance / EXPLOSION_RADIUS) * exposure
+        damage = int((impact * impact + impact) / 2 * 7 * EXPLOSION_RADIUS + 1)
+        self.agent.life = max(self.agent.life - damage, 0.0)
+        self.damage_taken += damage * 10
+
+    def tick(self) -> str:
+        """Simulates one game tick. Returns the observation JSON it produced."""
+        for command in self.pending_commands:
+            self.command(command)
+        self.pending_commands = []
+
+        if not self.layout.discrete_moves:
+            self.agent.yaw += self.turn_rate * TURN_DEGREES_PER_TICK
+            self.agent.pitch = float(np.clip(self.agent.pitch + self.pitch_rate * TURN_DEGREES_PER_TICK, -90, 90))
+            self.use_cooldown = max(self.use_cooldown - 1, 0)
+            if self.use_held and self.use_cooldown == 0:
+                self.place_block()
+                self.use_cooldown = USE_COOLDOWN_TICKS
+
+        for mob in self.mobs:
+            self.update_mob(mob)
+        self.fireballs = [fireball for fireball in self.fireballs if self.update_fireball(fireball)]
+
+        self.tick_count += 1
+        if self.layout.time_reward is not None:
+            self.pending_reward += self.layout.time_reward[1]
+            self.has_reward = True
+
+        if self.agent.life <= 0 or self.quit_requested:
+            self.running = False
+        return json.dumps(self.observation())
+
+    def observation(self) -> dict:
+        layout = self.layout
+        agent = self.agent
+        observations = {}
+
+        if layout.full_stats:
+            observations.update({
+                'Life': agent.life, 'IsAlive': agent.life > 0, 'Food': 20, 'XP': 0, 'Air': 300,
+                'DamageTaken': self.damage_taken, 'DamageDealt': 0, 'MobsKilled': 0, 'PlayersKilled': 0,
+                'DistanceTravelled': 0, 'TimeAlive': self.tick_count, 'TotalTime': self.tick_count,
+                'Name': layout.agent_name, 'XPos': agent.position[0], 'YPos': agent.position[1],
+                'ZPos': agent.position[2], 'Yaw': wrap_degrees(agent.yaw), 'Pitch': agent.pitch,
+            })
+
+        if layout.full_inventory or layout.hotbar:
+            keys = INVENTORY_KEYS if layout.full_inventory else HOTBAR_KEYS
+            for slot, (size_key, item_key) in enumerate(keys):
+                item, quantity = self.inventory.get(slot, ("air", 0))
+                observations[size_key] = quantity
+                observations[item_key] = item
+
+        if layout.ray:
+            target = self.raycast(RAY_LENGTH)
+            if target is not None:
+                cell, _, distance = target
+                observations['LineOfSight'] = {
+                    'hitType': 'block', 'x': int(cell[0]), 'y': int(cell[1]), 'z': int(cell[2]),
+                    'type': BLOCK_NAMES[self.world.blocks_at(cell[None])[0]],
+                    'inRange': distance <= REACH, 'distance': distance,
+                }
+
+        if layout.grid is not None:
+            name, low, high = layout.grid
+            feet = np.floor(agent.position).astype(np.int64)
+            region = self.world.region(feet + low, feet + high)
+            # Malmo lists the grid with x varying fastest, then z, then y.
+            names = np.array(BLOCK_NAMES)
+            observations[name] = names[region.transpose(1, 2, 0).ravel()].tolist()
+
+        if layout.entity_range is not None:
+            name, ranges = layout.entity_range
+            entities = []
+            for entity in [agent] + self.mobs + self.fireballs:
+                if all(abs(p - q) <= r for p, q, r in zip(entity.position, agent.position, ranges)):
+                    entities.append(entity.sight_entry())
+            observations[name] = entities
+
+        return observations
+
+
+class AgentHost:
+    """Simulated MalmoPython.AgentHost. Missions start instantly and the world
+    advances one tick per getWorldState call."""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+        self.mission: Optional[SimMission] = None
+        self.client: Optional[ClientInfo] = None
+        self.experiment_id = None
+        self.role = 0
+
+    def parse(self, args) -> None:
+        pass
+
+    def getUsage(self) -> str:
+        return "Simulated Malmo agent host, takes no arguments."
+
+    def startMission(self, mission_spec: MissionSpec, client_pool: ClientPool = None,
+                     mission_record_spec: MissionRecordSpec = None, role: int = 0, experiment_id: str = "") -> None:
+        if self.mission is not None and self.mission.running:
+            raise RuntimeError("A mission is already running.")
+        if client_pool is not None and client_pool.clients:
+            self.client = client_pool.clients[0]
+        self.role = role
+        self.experiment_id = experiment_id
+        damage_taken = self.mission.damage_taken if self.mission is not None else 0
+        self.mission = SimMission(mission_spec.layout, self.rng, damage_taken)
+
+    def sendCommand(self, command: str, key: str = "") -> None:
+        if self.mission is not None and self.mission.running:
+            self.mission.pending_commands.append(command)
+
+    def peekWorldState(self) -> WorldState:
+        mission = self.mission
+        if mission is None:
+            return WorldState()
+        return WorldState(True, mission.running)
+
+    def getWorldState(self) -> WorldState:
+        mission = self.mission
+        if mission is None:
+            return WorldState()
+        if not mission.running:
+            return WorldState(True, False)
+
+        observation = TimestampedString(mission.tick())
+        rewards = []
+        if mission.has_reward:
+            rewards.append(TimestampedReward(mission.pending_reward))
+            mission.pending_reward = 0.0
+            mission.has_reward = False
+        return WorldState(True, mission.running, [observation], rewards)
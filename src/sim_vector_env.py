@@ -0,0 +1,430 @@
+"""Batched simulator that steps many SteveTheBuilder worlds at once.
+
+Where sim_malmo simulates one world per environment, SimVectorEnv keeps the
+state of N worlds in NumPy arrays (voxels, yaw/pitch, Ghast and fireball
+positions, inventory counts, life and damage) and advances all of them with
+array operations, so there is no Python loop per world per step. It follows
+the same game rules as sim_malmo and computes the same observation and
+reward terms as SteveTheBuilder, and is exposed through RLlib's VectorEnv
+interface.
+
+Only the voxels within ARENA_RADIUS blocks of the agent are kept. That covers
+the agent's reach, the observation grid and the Ghast, which is everything
+SteveTheBuilder's missions can interact with since the agent never moves."""
+
+from typing import Dict
+
+import numpy as np
+from ray.rllib.env.vector_env import VectorEnv
+
+import main
+import sim_malmo
+from entity_tracker import bearing, facing
+from grid_encoding import quarter_turns
+from mission_layout import parse_mission_xml
+from sim_malmo import (BLOCK_IDS, BODY_CENTER_HEIGHT, EXPLOSION_RADIUS, EYE_HEIGHT, FIREBALL_HIT_RADIUS,
+                       FIREBALL_MAX_TICKS, FIREBALL_SPEED, GHAST_FIRE_INTERVAL, GHAST_FIRST_SHOT_TICKS,
+                       GHAST_HEIGHT, MAX_LIFE, REACH, TURN_DEGREES_PER_TICK, USE_COOLDOWN_TICKS)
+
+ARENA_RADIUS = 6
+ARENA_SIZE = 2 * ARENA_RADIUS + 1
+RAY_SAMPLES = np.arange(0, REACH, 0.1)
+SEGMENT_SAMPLES = np.linspace(0, 1, 5)[1:]
+EXPOSURE_SAMPLES = np.linspace(0, 1, 9)
+# Fireballs one world can have in flight: a Ghast fires every
+# GHAST_FIRE_INTERVAL ticks and a fireball flies up to FIREBALL_MAX_TICKS.
+MAX_FIREBALLS = -(-FIREBALL_MAX_TICKS // GHAST_FIRE_INTERVAL)
+
+# The Malmo ticks one SteveTheBuilder step spans with "event" step
+# synchronization on the sim backend: the drain after sending, then the poll.
+# Every action_repeat above 1 adds a tick.
+TICKS_PER_STEP = 2
+
+
+def wrap_degrees(angle: np.ndarray) -> np.ndarray:
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def look_directions(yaw: np.ndarray, pitch: np.ndarray) -> np.ndarray:
+    """(N, 3) unit vectors of Minecraft yaw/pitch angles in degrees."""
+    yaw = np.radians(yaw)
+    pitch = np.radians(pitch)
+    horizontal = np.cos(pitch)
+    return np.stack([-np.sin(yaw) * horizontal, -np.sin(pitch), np.cos(yaw) * horizontal], axis=1)
+
+
+class WorldTemplate:
+    """Starting state of every world created from one mission XML."""
+
+    def __init__(self, mission_xml: str):
+        layout = parse_mission_xml(mission_xml)
+        self.agent_position = np.array(layout.agent_position)
+        feet = np.floor(self.agent_position).astype(np.int64)
+        # World coordinates of the arena's low corner.
+        self.origin = feet - ARENA_RADIUS
+        self.voxels = sim_malmo.rasterize(layout, self.origin, self.origin + ARENA_SIZE - 1)
+        self.yaw = layout.agent_yaw
+        self.pitch = layout.agent_pitch
+        self.ghast_position = np.array(layout.entities[0][1:])
+        self.inventory = layout.inventory.get(0, ("air", 0))[1]
+        self.command_quota = layout.command_quota if layout.command_quota is not None else np.iinfo(np.int64).max
+        self.time_reward = layout.time_reward[1] if layout.time_reward is not None else 0.0
+        _, self.grid_low, self.grid_high = layout.grid
+
+
+class SimVectorEnv(VectorEnv):
+    """N simulated SteveTheBuilder worlds stepped together as NumPy arrays.
+
+    Built from a SteveTheBuilder on the sim backend, which provides the
+    mission XML, spaces and parameters, so both always agree."""
+
+    def __init__(self, env_config, num_worlds: int = None):
+        self.template = main.SteveTheBuilder(dict(env_config, backend="sim", metrics_file=None))
+        num_worlds = num_worlds or env_config.get('sim_num_worlds', main.sim_num_worlds)
+        assert not self.template.reward_shelter, "SimVectorEnv does not compute the reward_shelter reward."
+        super().__init__(self.template.observation_space, self.template.action_space, num_worlds)
+
+        self.discrete_moves = self.template.discrete_moves
+        self.block_quantity = self.template.block_quantity
+        self.obs_length = self.template.obs_array_length()
+        self.grid_encoder = self.template.grid_encoder
+        self.grid_length = self.grid_encoder.length
+        # Vocabulary id of every sim block id, see vocabulary_ids().
+        self.block_vocabulary_ids = np.zeros(0, dtype=np.uint8)
+        self.cobblestone = BLOCK_IDS[self.template.player_block]
+        self.ticks_per_step = env_config.get('sim_ticks_per_step', TICKS_PER_STEP + self.template.action_repeat - 1)
+        # Parsed missions keyed by their XML, every spawn variant is built once.
+        self.templates: Dict[str, WorldTemplate] = {}
+        first = self.world_template()
+        self.grid_low, self.grid_high = first.grid_low, first.grid_high
+
+        n = num_worlds
+        self.voxels = np.zeros((n, ARENA_SIZE, ARENA_SIZE, ARENA_SIZE), dtype=np.uint8)
+        self.origin = np.zeros((n, 3), dtype=np.int64)
+        self.agent_position = np.zeros((n, 3))
+        self.yaw = np.zeros(n)
+        self.pitch = np.zeros(n)
+        self.turn_rate = np.zeros(n)
+        self.pitch_rate = np.zeros(n)
+        self.use_held = np.zeros(n, dtype=bool)
+        self.use_cooldown = np.zeros(n, dtype=np.int64)
+        self.looking_down = np.ones(n, dtype=bool)
+        # Actions dropped in a row, see SteveTheBuilder.step.
+        self.rejected_streak = np.zeros(n, dtype=np.int64)
+        self.ghast_position = np.zeros((n, 3))
+        self.ghast_cooldown = np.zeros(n, dtype=np.int64)
+        # Fireball slots of every world, like sim_malmo's list of fireballs.
+        self.fireball_position = np.zeros((n, MAX_FIREBALLS, 3))
+        self.fireball_motion = np.zeros((n, MAX_FIREBALLS, 3))
+        self.fireball_age = np.zeros((n, MAX_FIREBALLS), dtype=np.int64)
+        self.fireball_alive = np.zeros((n, MAX_FIREBALLS), dtype=bool)
+        self.inventory = np.zeros(n, dtype=np.int64)
+        self.life = np.zeros(n)
+        self.damage = np.zeros(n, dtype=np.int64)
+        self.commands = np.zeros(n, dtype=np.int64)
+        self.command_quota = np.zeros(n, dtype=np.int64)
+        self.time_reward = np.zeros(n)
+        self.ended = np.zeros(n, dtype=bool)
+
+        # Episode statistics, as tracked by SteveTheBuilder.
+        self.last_damage = np.zeros(n, dtype=np.int64)
+        self.episode_damage = np.zeros(n, dtype=np.int64)
+        self.last_block_count = np.zeros(n, dtype=np.int64)
+        self.facing_ghast_count = np.zeros(n, dtype=np.int64)
+        self.correct_position_block = np.zeros(n, dtype=np.int64)
+        self.episode_return = np.zeros(n)
+        self.episode_step = np.zeros(n, dtype=np.int64)
+
+    def world_template(self) -> WorldTemplate:
+        mission_xml = self.template.get_mission_xml()
+        template = self.templates.get(mission_xml)
+        if template is None:
+            template = self.templates[mission_xml] = WorldTemplate(mission_xml)
+        return template
+
+    def vector_reset(self):
+        for i in range(self.num_envs):
+            self.reset_world(i)
+        return self.observe()
+
+    def reset_at(self, index: int):
+        self.reset_world(index)
+        return self.observe(np.array([index]))[0]
+
+    def reset_world(self, i: int) -> None:
+        template = self.world_template()
+        self.voxels[i] = template.voxels
+        self.origin[i] = template.origin
+        self.agent_position[i] = template.agent_position
+        self.yaw[i] = template.yaw
+        self.pitch[i] = template.pitch
+        self.turn_rate[i] = self.pitch_rate[i] = 0
+        self.use_held[i] = False
+        self.use_cooldown[i] = 0
+        self.looking_down[i] = True
+        self.rejected_streak[i] = 0
+        self.ghast_position[i] = template.ghast_position
+        self.ghast_cooldown[i] = GHAST_FIRST_SHOT_TICKS
+        self.fireball_alive[i] = False
+        self.inventory[i] = template.inventory
+        self.life[i] = MAX_LIFE
+        # DamageTaken counts on across a client's missions, so damage taken
+        # after the previous episode's last observation is rewarded on the
+        # first step of this one, as SteveTheBuilder does.
+        self.last_damage[i] -= self.damage[i]
+        self.damage[i] = 0
+        self.commands[i] = 0
+        self.command_quota[i] = template.command_quota
+        self.time_reward[i] = template.time_reward
+        self.ended[i] = False
+        self.episode_damage[i] = 0
+        self.last_block_count[i] = 0
+        self.facing_ghast_count[i] = 0
+        self.correct_position_block[i] = 0
+        self.episode_return[i] = 0
+        self.episode_step[i] = 0
+
+    def get_unwrapped(self):
+        return []
+
+    # Voxel helpers
+
+    def solid_at(self, worlds: np.ndarray, points: np.ndarray) -> np.ndarray:
+        """Whether the blocks at world-space points (len(worlds), K, 3) are
+        solid. Points outside the arena count as air."""
+        local = np.floor(points).astype(np.int64) - self.origin[worlds, None, :]
+        inside = ((local >= 0) & (local < ARENA_SIZE)).all(axis=2)
+        local = np.where(inside[..., None], local, 0)
+        ids = self.voxels[worlds[:, None], local[..., 0], local[..., 1], local[..., 2]]
+        return inside & (ids != BLOCK_IDS["air"]) & (ids != BLOCK_IDS["water"])
+
+    def place_blocks(self, worlds: np.ndarray) -> None:
+        """Places a block from inventory slot 0 against the block each world's
+        agent is looking at."""
+        worlds = worlds[self.inventory[worlds] > 0]
+        if len(worlds) == 0:
+            return
+        eyes = self.agent_position[worlds] + (0, EYE_HEIGHT, 0)
+        directions = look_directions(self.yaw[worlds], self.pitch[worlds])
+        points = eyes[:, None, :] + RAY_SAMPLES[None, :, None] * directions[:, None, :]
+        solid = self.solid_at(worlds, points)
+        hit = solid.argmax(axis=1)
+        can_place = solid.any(axis=1) & (hit > 0)
+
+        before = np.floor(points[np.arange(len(worlds)), np.maximum(hit - 1, 0)]).astype(np.int64)
+        feet = np.floor(self.agent_position[worlds]).astype(np.int64)
+        in_body = (before[:, 0] == feet[:, 0]) & (before[:, 2] == feet[:, 2]) & \
+                  (before[:, 1] >= feet[:, 1]) & (before[:, 1] <= feet[:, 1] + 1)
+        can_place &= ~in_body
+
+        worlds = worlds[can_place]
+        local = before[can_place] - self.origin[worlds]
+        self.voxels[worlds, local[:, 0], local[:, 1], local[:, 2]] = self.cobblestone
+        self.inventory[worlds] -= 1
+
+    # Simulation
+
+    def tick(self, active: np.ndarray) -> None:
+        """Simulates one game tick of the worlds in the boolean mask active."""
+        if not self.discrete_moves:
+            self.yaw += np.where(active, self.turn_rate * TURN_DEGREES_PER_TICK, 0)
+            self.pitch = np.clip(self.pitch + np.where(active, self.pitch_rate * TURN_DEGREES_PER_TICK, 0), -90, 90)
+            self.use_cooldown = np.maximum(self.use_cooldown - active, 0)
+            placing = active & self.use_held & (self.use_cooldown == 0)
+            self.place_blocks(np.flatnonzero(placing))
+            self.use_cooldown[placing] = USE_COOLDOWN_TICKS
+
+        # Ghasts shoot at the agent.
+        body = self.agent_position + (0, BODY_CENTER_HEIGHT, 0)
+        self.ghast_cooldown -= active
+        firing = np.flatnonzero(active & (self.ghast_cooldown <= 0))
+        if len(firing):
+            self.ghast_cooldown[firing] = GHAST_FIRE_INTERVAL
+            center = self.ghast_position[firing] + (0, GHAST_HEIGHT / 2, 0)
+            to_agent = body[firing] - center
+            direction = to_agent / np.linalg.norm(to_agent, axis=1, keepdims=True)
+            # The first free slot, there always is one (see MAX_FIREBALLS).
+            slot = np.argmin(self.fireball_alive[firing], axis=1)
+            self.fireball_position[firing, slot] = center + direction * (GHAST_HEIGHT / 2)
+            self.fireball_motion[firing, slot] = direction * FIREBALL_SPEED
+            self.fireball_age[firing, slot] = 0
+            self.fireball_alive[firing, slot] = True
+
+        # Fireballs fly until they hit a block or the agent.
+        flying, slots = np.nonzero(active[:, None] & self.fireball_alive)
+        if len(flying):
+            start = self.fireball_position[flying, slots]
+            motion = self.fireball_motion[flying, slots]
+            self.fireball_age[flying, slots] += 1
+            points = start[:, None, :] + SEGMENT_SAMPLES[None, :, None] * motion[:, None, :]
+            solid = self.solid_at(flying, points)
+            hits_block = solid.any(axis=1)
+            first = solid.argmax(axis=1)
+            block_point = np.where((first > 0)[:, None], points[np.arange(len(flying)), first - 1], start)
+
+            center = body[flying]
+            t = np.clip(((center - start) * motion).sum(axis=1) / (motion * motion).sum(axis=1), 0, 1)
+            closest = start + t[:, None] * motion
+            hits_agent = ~hits_block & (np.linalg.norm(closest - center, axis=1) < FIREBALL_HIT_RADIUS)
+
+            exploding = hits_block | hits_agent
+            self.explode(flying[exploding], np.where(hits_block[:, None], block_point, closest)[exploding])
+            self.fireball_position[flying, slots] = start + motion
+            self.fireball_alive[flying, slots] = ~exploding & (self.fireball_age[flying, slots] < FIREBALL_MAX_TICKS)
+
+    def explode(self, worlds: np.ndarray, points: np.ndarray) -> None:
+        """Damages the agents with Minecraft's explosion formula. A world may
+        be listed once per fireball exploding in it."""
+        center = self.agent_position[worlds] + (0, BODY_CENTER_HEIGHT, 0)
+        distance = np.linalg.norm(center - points, axis=1)
+        near = distance <= EXPLOSION_RADIUS
+        worlds, points, center, distance = worlds[near], points[near], center[near], distance[near]
+        if len(worlds) == 0:
+            return
+        line = points[:, None, :] + EXPOSURE_SAMPLES[None, :, None] * (center - points)[:, None, :]
+        exposure = ~self.solid_at(worlds, line).any(axis=1)
+        impact = (1 - distance / EXPLOSION_RADIUS) * exposure
+        damage = ((impact * impact + impact) / 2 * 7 * EXPLOSION_RADIUS + 1).astype(np.int64)
+        np.subtract.at(self.life, worlds, damage)
+        np.maximum(self.life, 0, out=self.life)
+        np.add.at(self.damage, worlds, damage * 10)
+
+    def facing_ghast(self, worlds: np.ndarray) -> np.ndarray:
+        """SteveTheBuilder.is_facing_ghast for the given worlds, False where
+        the agent and the Ghast share x and z."""
+        dx = self.ghast_position[worlds, 0] - self.agent_position[worlds, 0]
+        dz = self.ghast_position[worlds, 2] - self.agent_position[worlds, 2]
+        return facing(bearing(dx, dz), self.yaw[worlds])
+
+    def vocabulary_ids(self) -> np.ndarray:
+        """Returns the grid encoder's vocabulary id of every sim block id.
+        Rebuilt when the simulator has met new block names since."""
+        if len(self.block_vocabulary_ids) != len(sim_malmo.BLOCK_NAMES):
+            self.block_vocabulary_ids = self.grid_encoder.ids(sim_malmo.BLOCK_NAMES)
+        return self.block_vocabulary_ids
+
+    def observe(self, worlds: np.ndarray = None) -> np.ndarray:
+        """SteveTheBuilder.encode_observation for the given worlds (all by
+        default), all zeros for worlds whose mission ended. With action_mask,
+        a list of the Dict observations SteveTheBuilder.observation makes."""
+        if worlds is None:
+            worlds = np.arange(self.num_envs)
+        low, high = self.grid_low, self.grid_high
+        r = ARENA_RADIUS
+        grid = self.voxels[worlds, r + low[0]:r + high[0] + 1, r + low[1]:r + high[1] + 1, r + low[2]:r + high[2] + 1]
+        # Malmo lists the grid with x varying fastest, then z, then y.
+        grid = grid.transpose(0, 2, 3, 1).reshape(len(worlds), -1)
+
+        obs = np.zeros((len(worlds), self.obs_length), dtype=np.float32)
+        yaw = wrap_degrees(self.yaw[worlds])
+        yaw = np.where(yaw < 0, yaw + 360, yaw)
+        turns = quarter_turns(yaw) if self.template.yaw_obs_simplifier else None
+        obs[:, :self.grid_length] = self.grid_encoder.encode_ids(self.vocabulary_ids()[grid], turns)
+
+        if not self.template.yaw_obs_simplifier:
+            index = -1
+            obs[:, index] = yaw / 360
+            index -= 1
+            if self.template.reward_facing_ghast:
+                obs[:, index] = self.facing_ghast(worlds)
+                index -= 1
+            if self.template.obs_ghast_coordinate:
+                for axis in range(3):
+                    obs[:, index] = self.ghast_position[worlds, axis] / 2
+                    index -= 1
+            if self.template.obs_pitch:
+                obs[:, index] = self.pitch[worlds] / 90
+                index -= 1
+
+        obs[self.ended[worlds]] = 0
+        if self.template.action_mask:
+            masks = self.valid_actions(worlds)
+            return [{'action_mask': mask, 'observations': observations} for mask, observations in zip(masks, obs)]
+        return obs
+
+    def valid_actions(self, worlds: np.ndarray) -> np.ndarray:
+        """SteveTheBuilder.valid_actions for the given worlds."""
+        masks = np.ones((len(worlds), self.action_space.n), dtype=np.float32)
+        masks[:, 2] = ~self.looking_down[worlds]
+        masks[:, 3] = self.looking_down[worlds]
+        return masks
+
+    def vector_step(self, actions):
+        actions = np.asarray(actions)
+        placing_now = np.zeros(self.num_envs, dtype=bool)
+
+        if self.discrete_moves:
+            actions = actions.astype(np.int64)
+            look_down = actions == 2
+            look_up = actions == 3
+            # SteveTheBuilder.step_action drops looks past the two allowed pitches.
+            accepted = ~((look_down & self.looking_down) | (look_up & ~self.looking_down))
+            self.yaw += np.where(actions == 0, 90, 0) + np.where(actions == 1, -90, 0)
+            self.pitch = np.clip(self.pitch + 45 * (accepted & look_down) - 45 * (accepted & look_up), -90, 90)
+            self.looking_down ^= accepted & (look_down | look_up)
+            self.commands += accepted
+            self.episode_step += accepted
+            placing_now = accepted & (actions == 4)
+            # Worlds whose action was dropped skip the step, unless they
+            # dropped rejected_action_poll_every in a row, as SteveTheBuilder.step.
+            self.rejected_streak = np.where(accepted, 0, self.rejected_streak + 1)
+            stepping = accepted | (self.rejected_streak >= self.template.rejected_action_poll_every)
+            self.rejected_streak[stepping] = 0
+        else:
+            self.turn_rate = np.clip(actions[:, 0], -1, 1)
+            self.pitch_rate = np.clip(actions[:, 1], -1, 1)
+            self.use_held = actions[:, 2] > 0
+            self.commands += 3
+            self.episode_step += 1
+            stepping = np.ones(self.num_envs, dtype=bool)
+
+        rewards = np.zeros(self.num_envs)
+        quota_reached = self.commands >= self.command_quota
+        for t in range(self.ticks_per_step):
+            active = ~self.ended & stepping
+            if t == 0:
+                self.place_blocks(np.flatnonzero(placing_now & active))
+            self.tick(active)
+            rewards += active * self.time_reward
+            self.ended |= active & ((self.life <= 0) | quota_reached)
+
+        # Observation rewards only apply where an observation was received,
+        # as SteveTheBuilder.step_reward gets no frame once the mission ended.
+        alive = ~self.ended & stepping
+        new_damage = self.damage - self.last_damage
+        rewards -= np.where(alive, new_damage // 4, 0)
+        self.episode_damage += np.where(alive, new_damage, 0)
+        self.last_damage = np.where(alive, self.damage, self.last_damage)
+
+        blocks_placed = np.zeros(self.num_envs, dtype=bool)
+        if self.template.reward_blocks:
+            blocks_used = self.block_quantity - self.inventory
+            new_blocks = alive & (self.life > 0) & (blocks_used > self.last_block_count)
+            rewards += np.where(new_blocks, (blocks_used - self.last_block_count) * self.template.reward_mult, 0)
+            self.last_block_count = np.where(new_blocks, blocks_used, self.last_block_count)
+            blocks_placed = new_blocks
+
+        facing_reward = np.zeros(self.num_envs, dtype=bool)
+        if self.template.reward_facing_ghast:
+            facing = self.facing_ghast(np.arange(self.num_envs))
+            rewards += np.where(alive, np.where(facing, 2, -0.5), 0)
+            self.facing_ghast_count += alive & facing
+            facing_reward = alive
+
+        correct = blocks_placed & facing_reward
+        self.correct_position_block += correct
+        rewards += 2 * correct
+        self.episode_return += rewards
+
+        obs = self.observe()
+        dones = self.ended.copy()
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i] = {
+                'episode_return': self.episode_return[i],
+                'blocks_placed': int(self.last_block_count[i]),
+                'damage_taken': int(self.episode_damage[i]),
+                'face_ghast_count': int(self.facing_ghast_count[i]),
+                'correct_position_block': int(self.correct_position_block[i]),
+            }
+        return obs, rewards, dones, infos
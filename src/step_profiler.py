@@ -0,0 +1,186 @@
+"""Latency histograms of the SteveTheBuilder hot path.
+
+Code on the step path wraps its work in profiler.section(name). While the
+profiler is disabled, section() hands back a shared no-op context, so the
+hooks cost one method call. Once enabled, every section records its wall
+time into a log-scale histogram, from which percentiles are read.
+
+There is one profiler per process, so the histograms aggregate every
+environment of a rollout worker."""
+
+import json
+import math
+import time
+from typing import Dict, List
+
+# Histogram bins are log-scale, BINS_PER_DECADE per factor of 10 from
+# MIN_SECONDS to 10 ** DECADES times that. Percentiles are therefore
+# accurate to about 12%.
+BINS_PER_DECADE = 20
+MIN_SECONDS = 1e-6
+DECADES = 8
+NUM_BINS = DECADES * BINS_PER_DECADE + 1
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * NUM_BINS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        index = 0
+        if seconds > MIN_SECONDS:
+            index = min(int(math.log10(seconds / MIN_SECONDS) * BINS_PER_DECADE) + 1, NUM_BINS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Returns the upper edge of the bin holding the q-th percentile, in seconds."""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(MIN_SECONDS * 10 ** (index / BINS_PER_DECADE), self.max)
+        return self.max
+
+    def merge(self, other: 'Histogram') -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        return {'counts': self.counts, 'count': self.count, 'total': self.total, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        histogram = cls()
+        histogram.counts = list(data['counts'])
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.max = data['max']
+        return histogram
+
+
+class Timer:
+    """Context that records its wall time into a histogram."""
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.add(time.perf_counter() - self.start)
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class StepProfiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+
+    def section(self, name: str):
+        """Returns a context timing the code it wraps as the named section."""
+        if not self.enabled:
+            return NULL_TIMER
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return Timer(histogram)
+
+    def record(self, name: str, seconds: float) -> None:
+        """Records a duration measured by the caller into the named section."""
+        if self.enabled:
+            self.histograms.setdefault(name, Histogram()).add(seconds)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Returns the raw histograms, to be merged with other workers' through merge()."""
+        return {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+
+    def merge(self, snapshot: Dict[str, dict]) -> None:
+        for name, data in snapshot.items():
+            self.histograms.setdefault(name, Histogram()).merge(Histogram.from_dict(data))
+
+    def summary(self) -> Dict[str, dict]:
+        """Returns the count, mean, p50, p95, p99 and max of every section, in milliseconds."""
+        summary = {}
+        for name, histogram in sorted(self.histograms.items()):
+            summary[name] = {
+                'count': histogram.count,
+                'mean_ms': 1000 * histogram.total / max(histogram.count, 1),
+                'p50_ms': 1000 * histogram.percentile(50),
+                'p95_ms': 1000 * histogram.percentile(95),
+                'p99_ms': 1000 * histogram.percentile(99),
+                'max_ms': 1000 * histogram.max,
+            }
+        return summary
+
+    def dump(self, path: str) -> None:
+        """Writes the summary to a JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def merged(snapshots: List[Dict[str, dict]]) -> StepProfiler:
+    """Returns a profiler holding the sum of several snapshots."""
+    profiler = StepProfiler(enabled=True)
+    for snapshot in snapshots:
+        profiler.merge(snapshot)
+    return profiler
+
+
+class ProfiledAgentHost:
+    """Agent host wrapper timing the calls that go to the Minecraft client.
+    Only used while the profiler is enabled, so it costs nothing otherwise."""
+
+    def __init__(self, agent_host, profiler: StepProfiler):
+        self.agent_host = agent_host
+        self.profiler = profiler
+
+    def sendCommand(self, *args):
+        with self.profiler.section("send_command"):
+            return self.agent_host.sendCommand(*args)
+
+    def getWorldState(self):
+        with self.profiler.section("get_world_state"):
+            return self.agent_host.getWorldState()
+
+    def peekWorldState(self):
+        with self.profiler.section("peek_world_state"):
+            return self.agent_host.peekWorldState()
+
+    def startMission(self, *args):
+        with self.profiler.section("start_mission_request"):
+            return self.agent_host.startMission(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.agent_host, name)
+
+
+# The profiler of this process.
+profiler = StepProfiler()
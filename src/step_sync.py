@@ -0,0 +1,261 @@
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from observation_frame import ObservationFrame
+
+
+class StepSynchronizer:
+    """Waits for the first observation produced after an action was sent,
+    instead of sleeping a fixed amount of time.
+
+    Observations are ordered by the "TotalTime" tick count from
+    ObservationFromFullStats. An observation counts as fresh once its tick is
+    past the last tick seen when the action was sent, so the command has had
+    at least one game tick to land. With ticks_per_step above 1 the action is
+    held that many ticks before an observation counts as fresh.
+
+    Every world state polled in between is drained here, so the Malmo rewards
+    they carry are accumulated instead of dropped. The frame decoded to read
+    the tick is kept on self.frame so the step does not decode it again."""
+
+    def __init__(self, agent_host, timeout: float = 2.0, latency_target: float = 0.005, ticks_per_step: int = 1):
+        self.agent_host = agent_host
+        # Seconds to wait for a fresh observation before giving up on it.
+        self.timeout = timeout
+        # Seconds between polls, i.e. the most a step waits past the
+        # observation's arrival.
+        self.latency_target = latency_target
+        # Game ticks a step spans after its commands landed.
+        self.ticks_per_step = ticks_per_step
+
+        # Rewards from every world state polled since begin() was called.
+        self.rewards = []
+        # Latest frame decoded while polling, None if none since begin().
+        self.frame: Optional[ObservationFrame] = None
+        self.last_tick = None
+        self.since_tick = None
+        # Whether the last wait() gave up on its observation.
+        self.timed_out = False
+        # Whether self.rewards was cleared since the last wait(), which
+        # would otherwise count the previous step's rewards again.
+        self.began = False
+
+    def reset(self) -> None:
+        """Forget the previous mission, the next observation counts as fresh."""
+        self.rewards = []
+        self.frame = None
+        self.last_tick = None
+        self.since_tick = None
+        self.began = True
+
+    def send(self, commands: List[str]) -> None:
+        """Sends an action's commands, to be followed by begin()."""
+        for command in commands:
+            self.agent_host.sendCommand(command)
+
+    def pause(self) -> None:
+        """Hands the agent host back to the caller, e.g. for a reset. Nothing
+        runs in the background here, see AsyncStepSynchronizer."""
+
+    def begin(self) -> None:
+        """Call right after sending an action's commands.
+        Drains observations produced before the commands landed."""
+        self.rewards = []
+        self.observe(self.agent_host.getWorldState())
+        self.frame = None
+        self.since_tick = self.last_tick
+        self.began = True
+
+    def observe(self, world_state) -> bool:
+        """Mutates self.rewards, self.frame and self.last_tick.
+        Returns whether the world state holds an observation newer than begin()."""
+        self.rewards.extend(world_state.rewards)
+        for error in world_state.errors:
+            print("Error:", error.text)
+        frame = ObservationFrame.from_world_state(world_state)
+        if frame is None:
+            return False
+
+        self.frame = frame
+        tick = frame.total_time
+        fresh = tick is None or self.since_tick is None or tick >= self.since_tick + self.ticks_per_step
+        if tick is not None:
+            self.last_tick = tick
+        return fresh
+
+    def wait(self, world_state=None):
+        """Returns the first world state with a fresh observation, or the latest
+        world state if the mission ended or self.timeout passed first.
+
+        Args
+            world_state: <object> already polled world state to check first
+        """
+        if not self.began:
+            raise RuntimeError("wait() called again without begin(), the previous step's rewards would be counted twice.")
+        self.began = False
+        deadline = time.time() + self.timeout
+        self.timed_out = False
+        if world_state is None:
+            world_state = self.agent_host.getWorldState()
+        while True:
+            if self.observe(world_state) or not world_state.is_mission_running:
+                return world_state
+            if time.time() > deadline:
+                print(f"No observation within {self.timeout} seconds of the last action.")
+                self.timed_out = True
+                return world_state
+            time.sleep(self.latency_target)
+            world_state = self.agent_host.getWorldState()
+
+
+class AsyncStepSynchronizer(StepSynchronizer):
+    """StepSynchronizer whose I/O runs on a background thread during the
+    steps of an episode.
+
+    The first send() after a reset starts the thread, which then owns the
+    agent host: it sends each step's commands in one batch as soon as they
+    are queued, and keeps polling and decoding world states while the
+    policy computes the next action. Each decoded frame is built off to the
+    side and published by swapping it in under a lock, so wait() only picks
+    up the latest published frame and is woken the moment a fresh one
+    arrives, instead of polling and decoding itself.
+
+    pause() stops the thread, after which the synchronizer works like a
+    StepSynchronizer again, e.g. for the resets in between episodes.
+
+    With overlap, an observation counts as fresh once its tick is
+    ticks_per_step past the observation the previous step returned, rather
+    than past the step's own commands. Steps are then paced by game ticks
+    alone, so inference time and tick time overlap instead of adding up, at
+    the cost of observations lagging the latest action by up to the
+    inference time."""
+
+    def __init__(self, agent_host, timeout: float = 2.0, latency_target: float = 0.005, ticks_per_step: int = 1,
+                 overlap: bool = False):
+        super().__init__(agent_host, timeout, latency_target, ticks_per_step)
+        self.overlap = overlap
+        self.thread: Optional[threading.Thread] = None
+        self.condition = threading.Condition()
+        self.batches = queue.Queue()
+        self.stopping = False
+        # Everything below is written by the thread under self.condition.
+        # Batches queued and sent, and the last tick seen right after sending.
+        self.batches_queued = 0
+        self.batches_sent = 0
+        self.sent_tick = None
+        # Latest world state polled, latest frame and its tick, and the
+        # rewards of every world state polled since the last wait().
+        self.published_world_state = None
+        self.published_frame: Optional[ObservationFrame] = None
+        self.published_tick = None
+        self.pending_rewards = []
+        # Tick of the frame the previous wait() returned.
+        self.returned_tick = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def reset(self) -> None:
+        self.pause()
+        super().reset()
+
+    def pause(self) -> None:
+        """Stops the I/O thread once it sent the commands queued so far."""
+        if self.thread is None:
+            return
+        self.stopping = True
+        self.thread.join()
+        self.thread = None
+
+    def send(self, commands: List[str]) -> None:
+        """Queues an action's commands, which the I/O thread sends in one go."""
+        if self.thread is None:
+            self.start()
+        with self.condition:
+            self.batches_queued += 1
+        self.batches.put(commands)
+
+    def begin(self) -> None:
+        if self.thread is None:
+            super().begin()
+
+    def start(self) -> None:
+        self.stopping = False
+        self.batches_queued = self.batches_sent = 0
+        self.sent_tick = self.published_tick = self.returned_tick = self.last_tick
+        self.published_world_state = None
+        self.published_frame = None
+        self.pending_rewards = self.rewards = []
+        self.thread = threading.Thread(target=self.run, name="StepSynchronizer", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            try:
+                commands = self.batches.get(timeout=self.latency_target)
+            except queue.Empty:
+                commands = None
+                if self.stopping:
+                    return
+            if commands is not None:
+                for command in commands:
+                    self.agent_host.sendCommand(command)
+
+            world_state = self.agent_host.getWorldState()
+            for error in world_state.errors:
+                print("Error:", error.text)
+            frame = ObservationFrame.from_world_state(world_state)
+
+            with self.condition:
+                self.pending_rewards.extend(world_state.rewards)
+                self.published_world_state = world_state
+                if frame is not None:
+                    self.published_frame = frame
+                    if frame.total_time is not None:
+                        self.published_tick = frame.total_time
+                if commands is not None:
+                    self.batches_sent += 1
+                    self.sent_tick = self.published_tick
+                self.condition.notify_all()
+            if not world_state.is_mission_running:
+                self.stopping = True
+
+    def fresh(self) -> bool:
+        """Whether the published frame is the one to return, under self.condition."""
+        if self.published_world_state is None:
+            return False
+        if not self.published_world_state.is_mission_running:
+            return True
+        if self.overlap:
+            since = self.returned_tick
+        elif self.batches_sent < self.batches_queued:
+            return False
+        else:
+            since = self.sent_tick
+        frame = self.published_frame
+        if frame is None:
+            return False
+        tick = frame.total_time
+        return tick is None or since is None or tick >= since + self.ticks_per_step
+
+    def wait(self, world_state=None):
+        """Returns the first world state published with a fresh observation,
+        or the latest world state if the mission ended or self.timeout passed
+        first. self.frame and self.rewards are set as by StepSynchronizer.wait()."""
+        if self.thread is None:
+            return super().wait(world_state)
+        with self.condition:
+            self.timed_out = not self.condition.wait_for(self.fresh, self.timeout)
+            if self.timed_out:
+                print(f"No observation within {self.timeout} seconds of the last action.")
+            world_state = self.published_world_state
+            self.frame = self.published_frame
+            self.rewards, self.pending_rewards = self.pending_rewards, []
+            if self.frame is not None and self.frame.total_time is not None:
+                self.returned_tick = self.last_tick = self.frame.total_time
+        if world_state is None:
+            world_state = self.agent_host.peekWorldState()
+        return world_state
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import time
+from typing import Optional
+
+from mission_layout import MissionLayout
+
+# Prefix MalmoMod gives the worlds it creates for a mission in the saves directory.
+MALMO_WORLD_PREFIX = "TEMP_"
+TERRAIN_FILE = "terrain.json"
+
+
+class TerrainCache:
+    """Saved Minecraft worlds holding the terrain of each ProblemType.
+
+    The first mission of a problem type draws its terrain through
+    DrawingDecorator as usual, then the world MalmoMod created for it is
+    copied into the cache directory. Later missions start from that copy
+    through FileWorldGenerator, so the terrain is generated once instead of
+    on every mission, and the mission XML no longer carries it.
+
+    Both directories are paths on the Minecraft client's machine, so the
+    cache only works with clients that share this machine's filesystem."""
+
+    def __init__(self, directory: str, saves_dir: str):
+        self.directory = directory
+        self.saves_dir = saves_dir
+        # Problem type name -> saved world, once found on disk.
+        self.world_files = {}
+        # Problem type name -> terrain the saved world was drawn with.
+        self.terrains = {}
+
+    def world_path(self, name: str) -> str:
+        return os.path.abspath(os.path.join(self.directory, name))
+
+    def world_file(self, name: str) -> Optional[str]:
+        """Returns the saved world of a problem type, None if it was not saved yet."""
+        if name not in self.world_files:
+            path = self.world_path(name)
+            if not os.path.isfile(os.path.join(path, TERRAIN_FILE)):
+                return None
+            self.world_files[name] = path
+        return self.world_files[name]
+
+    def restore_terrain(self, name: str, layout: MissionLayout) -> MissionLayout:
+        """Mutates the layout of a mission started from the saved world to
+        also describe the terrain the world was saved with, so redrawing it
+        (soft resets) and simulating it work as with a drawn mission."""
+        if name not in self.terrains:
+            with open(os.path.join(self.world_path(name), TERRAIN_FILE)) as f:
+                self.terrains[name] = json.load(f)
+        terrain = self.terrains[name]
+        layout.generator_layers = list(terrain['generator_layers'])
+        draws = [tuple(draw) for draw in terrain['draws']]
+        layout.draws = draws + [draw for draw in layout.draws if draw not in draws]
+        return layout
+
+    def latest_malmo_world(self) -> Optional[str]:
+        """Returns the most recently written world MalmoMod created, None if there is none."""
+        worlds = [os.path.join(self.saves_dir, name) for name in os.listdir(self.saves_dir)
+                  if name.startswith(MALMO_WORLD_PREFIX)]
+        if not worlds:
+            return None
+        return max(worlds, key=os.path.getmtime)
+
+    def save(self, name: str, layout: MissionLayout, agent_host, timeout: float = 10.0) -> bool:
+        """
+        Saves the world of the running mission as the terrain of a problem
+        type. The mission must accept ChatCommands and must not have changed
+        its terrain yet. Its mobs are removed first so they are not saved
+        with the world, and summoned again afterwards.
+
+        Args
+            name: <str> problem type the world is saved for
+            layout: <MissionLayout> layout of the running mission
+            agent_host: <object> agent host running the mission
+            timeout: <float> seconds to wait for Minecraft to write the world
+
+        Returns
+            saved: <bool> whether the world was saved
+        """
+        started = time.time()
+        agent_host.sendCommand("chat /kill @e[type=!player]")
+        agent_host.sendCommand("chat /save-all flush")
+
+        # Minecraft writes level.dat last, so wait for it to be rewritten.
+        world = None
+        while time.time() - started < timeout:
+            world = self.latest_malmo_world()
+            if world is not None and os.path.getmtime(os.path.join(world, "level.dat")) >= started:
+                break
+            world = None
+            time.sleep(0.1)
+
+        for mob, x, y, z in layout.entities:
+            agent_host.sendCommand(f"chat /summon {mob.lower()} {x} {y} {z}")
+
+        if world is None:
+            print(f"TerrainCache: no saved Malmo world found in {self.saves_dir}, {name} terrain not cached.")
+            return False
+
+        # Copied aside first, since environments sharing the cache directory
+        # may all save their first mission's world at once.
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.world_path(name)
+        copy = f"{path}.{os.getpid()}"
+        shutil.copytree(world, copy, ignore=shutil.ignore_patterns("session.lock"))
+        with open(os.path.join(copy, TERRAIN_FILE), 'w') as f:
+            json.dump({'generator_layers': layout.generator_layers, 'draws': layout.draws}, f)
+        try:
+            os.rename(copy, path)
+            print(f"TerrainCache: saved {name} terrain to {path}")
+        except OSError:
+            # Another environment saved it first.
+            shutil.rmtree(copy)
+        return True
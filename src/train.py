@@ -0,0 +1,113 @@
+"""Trains SteveTheBuilder with RLlib, configured through the globals of main.py.
+
+    python train.py        # or python main.py
+
+Ray, the trainers and everything else only the trainer needs are imported
+here, so the rollout workers building environments from main.py never load
+them twice."""
+
+import ray
+from ray.rllib.agents import ppo
+from ray.rllib.agents import dqn
+from ray.rllib.agents.callbacks import DefaultCallbacks
+from ray.tune.registry import register_env
+
+import main
+import step_profiler
+from checkpoints import CheckpointWriter, latest_checkpoint, load_env_stats, restore_env_stats, restore_trainer
+from client_pool import load_clients
+
+
+class StepProfileCallbacks(DefaultCallbacks):
+    """Adds the step profiles of all rollout workers, merged, to every
+    trainer.train() result and writes them to profile_file."""
+
+    def on_train_result(self, *, trainer, result: dict, **kwargs) -> None:
+        snapshots = trainer.workers.foreach_worker(lambda worker: step_profiler.profiler.snapshot())
+        profile = step_profiler.merged(snapshots)
+        result['step_profile'] = profile.summary()
+        if main.profile_file is not None:
+            profile.dump(main.profile_file)
+
+
+def train() -> None:
+    ray.init()
+
+    # One rollout worker per envs_per_worker environments' clients, or the
+    # local worker alone when a single environment uses all the clients.
+    client_pool = load_clients(main.clients, main.client_file)
+    clients_per_env = 2 if main.pipelined_reset else 1
+    num_workers = max(len(client_pool) // (main.envs_per_worker * clients_per_env), 1) if len(client_pool) > clients_per_env else 0
+    env_config = {
+        'clients': [f"{host}:{port}" for host, port in client_pool],
+        'spare_clients': main.spare_clients,
+        'envs_per_worker': main.envs_per_worker,
+        'pipelined_reset': main.pipelined_reset,
+        'profile_steps': main.profile_steps,
+    }
+
+    checkpoint = None
+    if main.checkpoint_dir is not None and main.resume:
+        checkpoint = latest_checkpoint(main.checkpoint_dir)
+    # The environments continue the metrics of the run being resumed.
+    env_config['resume_stats'] = checkpoint is not None
+
+    env = main.SteveTheBuilder
+    if main.replay_file is not None:
+        from replay_env import ReplayEnv
+        register_env("SteveTheBuilderReplay", lambda env_config: ReplayEnv(env_config))
+        env = "SteveTheBuilderReplay"
+    elif main.backend == "sim" and main.sim_num_worlds > 0:
+        from sim_vector_env import SimVectorEnv
+        register_env("SteveTheBuilderVector", lambda env_config: SimVectorEnv(env_config))
+        env = "SteveTheBuilderVector"
+
+    if main.discrete_moves:
+        dqn_config = {
+            'env_config': env_config,   # Client pool of the environments
+            'framework': 'torch',       # Use pyotrch instead of tensorflow
+            'num_gpus': 0,              # We aren't using GPUs
+            'num_workers': num_workers, # One worker per envs_per_worker environments
+            'num_envs_per_worker': main.envs_per_worker,
+            'callbacks': StepProfileCallbacks if main.profile_steps else DefaultCallbacks
+        }
+        if main.action_mask:
+            import action_mask_model  # Registers the "action_mask" model
+            dqn_config.update({
+                'model': {'custom_model': "action_mask"},
+                # The model's outputs are the Q-values, so they can be masked.
+                'hiddens': [],
+                'dueling': False,
+            })
+        trainer = dqn.DQNTrainer(env=env, config=dqn_config)
+    else:
+        trainer = ppo.PPOTrainer(env=env, config={
+        'env_config': env_config,   # Client pool of the environments
+        'framework': 'torch',       # Use pyotrch instead of tensorflow
+        'num_gpus': 0,              # We aren't using GPUs
+        'num_workers': num_workers, # One worker per envs_per_worker environments
+        'num_envs_per_worker': main.envs_per_worker,
+        'callbacks': StepProfileCallbacks if main.profile_steps else DefaultCallbacks
+        })
+
+    if checkpoint is not None:
+        restore_trainer(trainer, checkpoint)
+        restore_env_stats(trainer, load_env_stats(checkpoint))
+        print(f"Resumed from {checkpoint}")
+
+    writer = None
+    if main.checkpoint_dir is not None:
+        writer = CheckpointWriter(main.checkpoint_dir, main.checkpoint_keep)
+    try:
+        while True:
+            print(trainer.train())
+            if writer is not None and trainer.iteration % main.checkpoint_every == 0:
+                writer.save(trainer)
+    finally:
+        # Let the checkpoint being written complete, e.g. on KeyboardInterrupt.
+        if writer is not None:
+            writer.close()
+
+
+if __name__ == '__main__':
+    train()